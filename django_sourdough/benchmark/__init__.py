@@ -0,0 +1,27 @@
+'''
+
+Bake throughput benchmark.
+
+A self contained django project (synthetic settings, a SQLite database
+in a temporary directory and a generated views module) that times
+BakeView.bake and writes pages/sec for each combination of:
+
+page count
+template - simple or complex (inheritance, includes, loops, filters)
+social - LogicalURLView or LogicalSocialView
+minifier - BAKE_MINIFIER backend (htmlmin, sourdough, none)
+jobs - serial, or a process pool
+write_threads - writing in the bake thread, or writer threads
+
+run with:
+
+python -m django_sourdough.benchmark --pages 100 1000 --jobs 1 4
+    --output before.json
+
+and compare a later run against it with --compare before.json
+
+python -m django_sourdough.benchmark.minify times the minifier
+backends on their own and checks the built in minifier's output
+against htmlmin's.
+
+'''
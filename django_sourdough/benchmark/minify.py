@@ -0,0 +1,120 @@
+'''
+
+Times the BAKE_MINIFIER backends and checks the built in minifier
+against htmlmin.
+
+python -m django_sourdough.benchmark.minify --pages 200
+
+Pages are rendered from the benchmark views, plus the samples below.
+Outputs are equivalent if they are the same once both have been
+parsed and serialised by html5lib (so htmlmin's rewriting of tags and
+entities is not counted as a difference).
+
+'''
+
+import argparse
+import sys
+import tempfile
+import time
+
+from .run import populate, setup_django
+
+samples = [
+    "<p>Some   <b>bold</b> and <i>italic</i>\n text</p>",
+    "<div>\n  <p> block </p>\n  <p>two</p>\n</div>",
+    "<div><p>a</p> <!-- comment --> <p>b</p></div><!-- another -->",
+    "<p>line<br>\n  next <span> x </span> <em>y</em></p>",
+    "<pre>  keep\n    this  </pre><textarea>  and\n this </textarea>",
+    "<script>\n  var x = '<p>  </p>';\n</script><p> after </p>",
+    "<ul>\n<li><a href='/a/'> one </a></li>\n<li>\t two</li>\n</ul>",
+    "<p>non&nbsp;breaking \xa0 space</p>",
+    "<!--[if IE]>\n  <p>old</p>\n<![endif]--><p>new</p>",
+    "<p><a title='a > b'  href=\"/x/\">  link </a> text</p>",
+    "<p>1 < 2 and   3 > 2</p>",
+]
+
+
+def sample_pages(count):
+    from django.test.client import RequestFactory
+    from .models import BenchItem
+    from . import views
+
+    slugs = list(BenchItem.objects.order_by("id")
+                 .values_list("slug", flat=True)[:count])
+    pages = []
+    for view in views.bench_views.values():
+        v = view()
+        for slug in slugs:
+            request = RequestFactory().get("/")
+            context = v._get_view_context(request, slug)
+            pages.append(v.context_to_html(request, context).content)
+    return pages
+
+
+def normalise(html):
+    import bs4
+    return str(bs4.BeautifulSoup(html, "html5lib"))
+
+
+def check_equivalence(pages, reference, candidate):
+    """
+    returns the pages where candidate and reference disagree
+    """
+    different = []
+    for p in pages:
+        if normalise(reference(p)) != normalise(candidate(p)):
+            different.append(p)
+    return different
+
+
+def time_backend(minifier, pages):
+    start = time.time()
+    for p in pages:
+        minifier(p)
+    return time.time() - start
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m django_sourdough.benchmark.minify",
+        description="Compare minifier backends")
+    parser.add_argument("--pages", type=int, default=200,
+                        help="items rendered for each benchmark view")
+    parser.add_argument("--minifier", nargs="+",
+                        default=["htmlmin", "sourdough", "none"])
+    args = parser.parse_args(argv)
+
+    setup_django(tempfile.mkdtemp(prefix="sourdough_bench_"))
+    populate(args.pages)
+    from ..views.minify import get_minifier
+
+    pages = sample_pages(args.pages)
+    size = sum(len(p) for p in pages)
+    print("{0} pages, {1} bytes".format(len(pages), size))
+    for name in args.minifier:
+        seconds = time_backend(get_minifier(name), pages)
+        print("{0}: {1:.3f}s, {2:.0f} pages/sec, {3:.1f} MB/sec".format(
+            name, seconds, len(pages) / seconds, size / seconds / 1000000))
+
+    try:
+        import bs4
+        import htmlmin
+    except ImportError:
+        print("htmlmin not installed - equivalence not checked")
+        return
+    samples_bytes = [x.encode("utf-8") for x in samples]
+    different = check_equivalence(samples_bytes + pages,
+                                  get_minifier("htmlmin"),
+                                  get_minifier("sourdough"))
+    print("{0} of {1} pages differ from htmlmin".format(
+        len(different), len(pages) + len(samples)))
+    for d in different[:5]:
+        print(d.decode("utf-8"))
+        print("htmlmin:   " + normalise(get_minifier("htmlmin")(d)))
+        print("sourdough: " + normalise(get_minifier("sourdough")(d)))
+    if different:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,13 @@
+from django.db import models
+
+
+class BenchItem(models.Model):
+    slug = models.CharField(max_length=50, db_index=True)
+    name = models.CharField(max_length=255)
+    body = models.TextField()
+
+
+class BenchTag(models.Model):
+    item = models.ForeignKey(BenchItem, on_delete=models.CASCADE)
+    name = models.CharField(max_length=255)
+    value = models.IntegerField()
@@ -0,0 +1,175 @@
+'''
+
+Runs the bake benchmark and writes results as JSON.
+
+Each result is keyed by its configuration so two result files
+(e.g. before and after a change) can be compared with --compare.
+
+'''
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from datetime import datetime
+from itertools import product
+
+words = ["bread", "flour", "water", "salt", "starter", "crust", "crumb",
+         "oven", "proof", "dough", "levain", "rye", "spelt", "knead"]
+
+
+def setup_django(bench_dir):
+    os.environ["SOURDOUGH_BENCH_DIR"] = bench_dir
+    os.environ["DJANGO_SETTINGS_MODULE"] = "django_sourdough.benchmark.settings"
+    import django
+    django.setup()
+    from django.core.management import call_command
+    call_command("migrate", run_syncdb=True, verbosity=0)
+
+
+def populate(count, tags_per_item=20):
+    from .models import BenchItem, BenchTag
+    r = random.Random(0)
+    items = []
+    for n in range(count):
+        body = " ".join(r.choice(words) for x in range(80))
+        items.append(BenchItem(slug="item-{0}".format(n),
+                               name="Item {0} {1}".format(n, r.choice(words)),
+                               body=body))
+    BenchItem.objects.bulk_create(items, batch_size=500)
+    tags = []
+    for item in BenchItem.objects.all():
+        for n in range(tags_per_item):
+            tags.append(BenchTag(item=item,
+                                 name="{0} {1}".format(r.choice(words), n),
+                                 value=r.randint(1, 1000)))
+    BenchTag.objects.bulk_create(tags, batch_size=500)
+
+
+def bake_options(**kwargs):
+    """
+    the bake command's defaults, with overrides
+    """
+    from ..management.commands.bake import Command
+    parser = Command().create_parser("manage.py", "bake")
+    options = vars(parser.parse_args([]))
+    options.update(kwargs)
+    return options
+
+
+def config_key(config):
+    return "|".join("{0}={1}".format(k, config[k]) for k in sorted(config))
+
+
+def run_one(config):
+    from django.conf import settings
+    from django.test.utils import override_settings
+    from ..views.bake import BaseBakeManager
+    from . import views
+
+    view = views.bench_views[(config["template"], config["social"])]
+    view.bench_pages = config["pages"]
+    shutil.rmtree(settings.BAKE_LOCATION, ignore_errors=True)
+
+    options = bake_options(only_views=[view.url_name],
+                           skip_static=True,
+                           verbose_level=0,
+                           jobs=config["jobs"],
+                           write_threads=config["write_threads"])
+    manager = BaseBakeManager(views)
+    with override_settings(BAKE_MINIFIER=config["minifier"]), \
+            redirect_stdout(io.StringIO()):
+        start = time.time()
+        manager.bake(options)
+        seconds = time.time() - start
+    result = dict(config)
+    result["seconds"] = round(seconds, 4)
+    result["pages_per_second"] = round(config["pages"] / seconds, 2)
+    return result
+
+
+def compare(results, previous_path):
+    with open(previous_path) as f:
+        previous = {config_key(x["config"]): x for x in json.load(f)["results"]}
+    for r in results:
+        old = previous.get(config_key(r["config"]))
+        if old is None:
+            continue
+        change = r["pages_per_second"] / old["pages_per_second"] - 1
+        print("{0}: {1} -> {2} pages/sec ({3:+.1%})".format(
+            config_key(r["config"]), old["pages_per_second"],
+            r["pages_per_second"], change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m django_sourdough.benchmark",
+        description="Measure BakeView.bake throughput")
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--templates", nargs="+", default=["simple", "complex"],
+                        choices=["simple", "complex"])
+    parser.add_argument("--social", nargs="+", default=["off", "on"],
+                        choices=["off", "on"])
+    parser.add_argument("--minifier", nargs="+",
+                        default=["htmlmin", "sourdough", "none"],
+                        help="BAKE_MINIFIER backends to compare")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--write_threads", type=int, nargs="+", default=[0])
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs of each configuration - the fastest is kept")
+    parser.add_argument("--output", default="bake_benchmark.json")
+    parser.add_argument("--compare", help="previous results file")
+    parser.add_argument("--label", default="", help="stored with the results")
+    args = parser.parse_args(argv)
+
+    bench_dir = tempfile.mkdtemp(prefix="sourdough_bench_")
+    try:
+        setup_django(bench_dir)
+        populate(max(args.pages))
+
+        results = []
+        for pages, template, social, minifier, jobs, threads in product(
+                args.pages, args.templates, args.social, args.minifier,
+                args.jobs, args.write_threads):
+            config = {"pages": pages,
+                      "template": template,
+                      "social": social == "on",
+                      "minifier": minifier,
+                      "jobs": jobs,
+                      "write_threads": threads}
+            runs = [run_one(config) for x in range(max(args.repeat, 1))]
+            best = max(runs, key=lambda x: x["pages_per_second"])
+            result = {"config": config,
+                      "seconds": best["seconds"],
+                      "pages_per_second": best["pages_per_second"]}
+            results.append(result)
+            print("{0}: {1} pages/sec".format(config_key(config),
+                                              result["pages_per_second"]))
+    finally:
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    import django
+    output = {"generated": datetime.now().isoformat(),
+              "label": args.label,
+              "python": platform.python_version(),
+              "django": django.get_version(),
+              "platform": platform.platform(),
+              "cpus": os.cpu_count(),
+              "results": results}
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=1)
+    print("results written to {0}".format(args.output))
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+'''
+
+Synthetic settings for the bake benchmark.
+
+The database and bake location are in SOURDOUGH_BENCH_DIR
+(a temporary directory created by run.py).
+
+'''
+
+import os
+import tempfile
+
+BENCH_DIR = os.environ.get("SOURDOUGH_BENCH_DIR") or tempfile.mkdtemp()
+
+SECRET_KEY = "benchmark"
+DEBUG = False
+ALLOWED_HOSTS = ["*"]
+USE_TZ = True
+DEFAULT_AUTO_FIELD = "django.db.models.AutoField"
+
+INSTALLED_APPS = ["django.contrib.contenttypes",
+                  "django_sourdough",
+                  "django_sourdough.benchmark"]
+
+DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3",
+                         "NAME": os.path.join(BENCH_DIR, "bench.sqlite3")}}
+
+ROOT_URLCONF = "django_sourdough.benchmark.urls"
+
+BAKE_LOCATION = os.path.join(BENCH_DIR, "baked")
+STATIC_ROOT = os.path.join(BENCH_DIR, "static")
+SITE_ROOT = "https://example.com"
+
+bench_templates = {
+    "simple.html": """<!DOCTYPE html>
+<html>
+<head><title>{{item.name}}</title></head>
+<body>
+    <h1>{{item.name}}</h1>
+    <p>{{item.body}}</p>
+</body>
+</html>
+""",
+    "base.html": """<!DOCTYPE html>
+<html>
+<head>
+    <title>{% block title %}{% endblock %}</title>
+    {% if social_settings %}
+    <meta property="og:title" content="{{social_settings.share_title}}">
+    <meta property="og:description" content="{{social_settings.share_description}}">
+    <meta property="og:url" content="{{social_settings.url}}">
+    {% endif %}
+</head>
+<body>
+    <nav><ul>{% for n in nav %}<li><a href="/{{n|slugify}}/">{{n|title}}</a></li>{% endfor %}</ul></nav>
+    <main>{% block content %}{% endblock %}</main>
+    <footer>{% now "Y" %}</footer>
+</body>
+</html>
+""",
+    "complex.html": """{% extends "base.html" %}
+{% block title %}{{item.name}}{% endblock %}
+{% block content %}
+    <h1>{{item.name|upper}}</h1>
+    <p>{{item.body|linebreaksbr}}</p>
+    <table>
+        <tr><th>Name</th><th>Value</th><th>Share</th></tr>
+        {% for tag in tags %}
+        {% include "row.html" %}
+        {% empty %}
+        <tr><td colspan="3">None</td></tr>
+        {% endfor %}
+    </table>
+    <p>{{tags|length}} tags, total {{total|floatformat:2}}</p>
+{% endblock %}
+""",
+    "row.html": """<tr class="{% cycle 'odd' 'even' %}">
+            <td>{{tag.name|truncatechars:20}}</td>
+            <td>{{tag.value|default:"-"}}</td>
+            <td>{% widthratio tag.value total 100 %}%</td>
+        </tr>""",
+}
+
+TEMPLATES = [{"BACKEND": "django.template.backends.django.DjangoTemplates",
+              "DIRS": [],
+              "APP_DIRS": False,
+              "OPTIONS": {"context_processors": [],
+                          "loaders": [("django.template.loaders.locmem.Loader",
+                                       bench_templates)]}}]
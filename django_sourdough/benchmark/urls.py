@@ -0,0 +1,5 @@
+from django.conf.urls import url
+
+from ..views import include_view
+
+urlpatterns = [url(r'^', include_view('django_sourdough.benchmark.views'))]
@@ -0,0 +1,62 @@
+'''
+
+Generated views for the benchmark - one LogicalURLView subclass for
+each template/social combination, named e.g. bench_complex_social.
+
+bench_pages is set by the runner to limit how many items are baked.
+
+'''
+
+from ..views import LogicalSocialView, LogicalURLView
+from .models import BenchItem, BenchTag
+
+templates = ["simple", "complex"]
+nav = ["home", "about", "data", "downloads", "contact"]
+
+
+class BenchMixin(object):
+    bench_pages = 100
+    args = ["slug"]
+
+    def bake_args(self, limit_query=None):
+        q = BenchItem.objects.order_by("id")
+        if limit_query:
+            q = limit_query.filter(q, "slug")
+        return ((x,) for x in q.values_list("slug", flat=True)[:self.bench_pages])
+
+    def logic(self):
+        self.item = BenchItem.objects.get(slug=self.slug)
+        if self.__class__.template == "complex.html":
+            self.tags = list(BenchTag.objects.filter(item=self.item))
+            self.total = sum(x.value for x in self.tags)
+            self.nav = nav
+
+
+def view_name(template, social):
+    name = "bench_" + template
+    if social:
+        name += "_social"
+    return name
+
+
+def make_view(template, social):
+    name = view_name(template, social)
+    attrs = {"template": template + ".html",
+             "url_pattern": r"^{0}/(.*)/$".format(name),
+             "url_name": name}
+    if social:
+        base = LogicalSocialView
+        attrs.update({"page_title": "{{item.name}}",
+                      "share_title": "{{item.name}}",
+                      "share_description": "{{item.body|truncatewords:20}}",
+                      "share_url": "{{SITE_ROOT}}/{{item.slug}}/"})
+    else:
+        base = LogicalURLView
+    return type(name, (BenchMixin, base), attrs)
+
+
+bench_views = {}
+for t in templates:
+    for s in [False, True]:
+        bench_views[(t, s)] = make_view(t, s)
+        globals()[view_name(t, s)] = bench_views[(t, s)]
@@ -3,13 +3,14 @@ from __future__ import absolute_import
 from importlib import import_module
 import os
 
-from dirsync import sync
-
-from django.core.management import BaseCommand
+from django.core.management import BaseCommand, CommandError
 from django.conf import settings
 from django.apps import apps as project_apps
 from ...views import AppUrl
-from ...views.bake import BaseBakeManager
+from ...views.bake import BakeRun, BaseBakeManager
+from ...views.coordinator import WorkQueue
+from ...views.output_index import output_index_sources
+from ...views.static_sync import static_modes
 
 
 class Command(BaseCommand):
@@ -36,6 +37,13 @@ class Command(BaseCommand):
             help='Only create absent files',
         )
 
+        parser.add_argument(
+            '--output_index',
+            default='scan',
+            choices=output_index_sources,
+            help='How --only_absent/--only_old find existing files: scan the bake location once, use bake_manifest.json, or check each file',
+        )
+
         parser.add_argument(
             '--only_views',
             nargs="*",
@@ -44,6 +52,25 @@ class Command(BaseCommand):
             help='restrict to this view name only',
         )
 
+        parser.add_argument(
+            '--only_changed',
+            action='store_true',
+            help='Only rewrite files with changed content (uses a manifest)',
+        )
+
+        parser.add_argument(
+            '--track_dependencies',
+            action='store_true',
+            help='Record the database tables each page reads',
+        )
+
+        parser.add_argument(
+            '--changed_since',
+            default=None,
+            type=str,
+            help='Only render pages reading tables changed by this populate run (or "last") and later',
+        )
+
         parser.add_argument(
             '--only_old',
             nargs="?",
@@ -66,6 +93,70 @@ class Command(BaseCommand):
             help='Skip the static sync',
         )
 
+        parser.add_argument(
+            '--static_mode',
+            default='copy',
+            choices=static_modes,
+            help='copy, hardlink or reflink static files (default copy)',
+        )
+
+        parser.add_argument(
+            '--static_delete',
+            action='store_true',
+            help='Remove synced static files no longer in the source',
+        )
+
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip pages finished by the last bake (from bake_journal)',
+        )
+
+        parser.add_argument(
+            '--plan',
+            action='store_true',
+            help='Count the pages each view would bake (with an estimated time) without baking',
+        )
+
+        parser.add_argument(
+            '--coordinate',
+            type=str,
+            help='Bake as one of several workers sharing this queue file',
+        )
+
+        parser.add_argument(
+            '--worker_name',
+            type=str,
+            help='Name for this worker in the --coordinate queue (default host-pid)',
+        )
+
+        parser.add_argument(
+            '--lease',
+            default=600.0,
+            type=float,
+            help='Seconds before a batch leased from the --coordinate queue can be taken by another worker',
+        )
+
+        parser.add_argument(
+            '--coordinate_status',
+            action='store_true',
+            help='Print the progress of the --coordinate queue and exit',
+        )
+
+        parser.add_argument(
+            '--retry_backoff',
+            default=5.0,
+            type=float,
+            help='Seconds before a page with an error is retried - doubled for each later retry (default 5)',
+        )
+
+        parser.add_argument(
+            '--retry_backoff_max',
+            default=300.0,
+            type=float,
+            help='Longest wait before a retry (default 300)',
+        )
+
         parser.add_argument(
             '--skip_errors',
             action='store_true',
@@ -91,6 +182,12 @@ class Command(BaseCommand):
             help='Which worker this is, divides queues into sections',
         )
 
+        parser.add_argument(
+            '--cost_order',
+            action='store_true',
+            help='Bake slowest pages first and balance --worker/--jobs by render times from earlier bakes (bake_timings.json)',
+        )
+
         parser.add_argument(
             '--worker_count',
             default=4,
@@ -98,6 +195,94 @@ class Command(BaseCommand):
             help='Number of workers (ignored if no worker param)',
         )
 
+        parser.add_argument(
+            '--jobs',
+            default=1,
+            type=int,
+            help='Number of processes to bake with (forks a pool if > 1)',
+        )
+
+        parser.add_argument(
+            '--concurrency',
+            default=None,
+            type=int,
+            help='Pages of views with async logic to bake at once (default is the view\'s bake_concurrency)',
+        )
+
+        parser.add_argument(
+            '--archive',
+            default=None,
+            type=str,
+            help='Bake into this .zip, .tar(.gz/.xz/.zst) or .pack file instead of loose files',
+        )
+
+        parser.add_argument(
+            '--write_threads',
+            default=0,
+            type=int,
+            help='Threads writing files in the background (default 0 - write inline)',
+        )
+
+        parser.add_argument(
+            '--fsync',
+            default="none",
+            choices=["none", "each", "end"],
+            help='When to fsync written files (default none)',
+        )
+
+        parser.add_argument(
+            '--precompress',
+            nargs="*",
+            default=[],
+            choices=["gz", "br"],
+            help='Also write compressed versions of baked and static files',
+        )
+
+        parser.add_argument(
+            '--precompress_min_size',
+            default=1024,
+            type=int,
+            help='Smallest file (in bytes) to precompress (default 1024)',
+        )
+
+        parser.add_argument(
+            '--profile',
+            action='store_true',
+            help='Time each phase of each page - report in bake_profile.json',
+        )
+
+        parser.add_argument(
+            '--profile_trace',
+            action='store_true',
+            help='Profile, and also write a Chrome trace to bake_trace.json',
+        )
+
+        parser.add_argument(
+            '--count_queries',
+            action='store_true',
+            help='Count SQL queries per page - report in bake_queries.json',
+        )
+
+        parser.add_argument(
+            '--check_paths',
+            action='store_true',
+            help='Check compiled bake paths against reverse()',
+        )
+
+        parser.add_argument(
+            '--progress',
+            dest='progress_path',
+            type=str,
+            help='Write progress events as json lines to this file or named pipe',
+        )
+
+        parser.add_argument(
+            '--progress_interval',
+            default=5.0,
+            type=float,
+            help='Seconds between progress reports',
+        )
+
         parser.add_argument(
             '--verbose_level',
             default=2,
@@ -114,10 +299,18 @@ class Command(BaseCommand):
             )
 
     def handle(self, *args, **options):
+        if options["coordinate_status"]:
+            if not options["coordinate"]:
+                raise CommandError("--coordinate_status needs --coordinate")
+            WorkQueue(options["coordinate"]).print_status()
+            return
+
         apps = [x for x in options['app']]
 
         if len(apps) == 0:
             apps = [x.name for x in project_apps.get_app_configs()]
+        # manifest and reports cover every app baked
+        options["bake_run"] = BakeRun()
         for app in apps:
             manager = None
             try:
@@ -132,6 +325,10 @@ class Command(BaseCommand):
             # run custom bake command
             if bake_module:
                 if hasattr(bake_module, "bake"):
+                    if options["plan"]:
+                        print("{0} has its own bake function - can't "
+                              "plan".format(app))
+                        continue
                     bake_module.bake()
                     continue
 
@@ -142,3 +339,4 @@ class Command(BaseCommand):
                     manager = BaseBakeManager(views_module)
             if manager:
                 manager.bake(options)
+        options["bake_run"].save()
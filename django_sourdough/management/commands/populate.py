@@ -1,6 +1,8 @@
 from django.core.management import BaseCommand
 from importlib import import_module
 from django.apps import apps as project_apps
+from django.conf import settings
+from ...views.dependencies import PopulateLog, record_tables
 
 
 class Command(BaseCommand):
@@ -16,6 +18,9 @@ class Command(BaseCommand):
     an argument specified after --option is
     passed through as a position argument
 
+    if BAKE_LOCATION is set, tables written to are
+    recorded for bake --changed_since
+
     """
     help = "Enter an app to populate"
 
@@ -28,11 +33,18 @@ class Command(BaseCommand):
         extra_options = [x for x in [options['option']] if x]
         if len(apps) == 0:
             apps = [x.name for x in project_apps.get_app_configs()]
-        for app in apps:
-            try:
-                app = import_module(app + ".populate")
-            except ImportError:
-                continue
-
-            if callable(app.populate):
-                app.populate(*extra_options)
+        track = hasattr(settings, "BAKE_LOCATION")
+        with record_tables(track, writes_only=True) as tables:
+            for app in apps:
+                try:
+                    app = import_module(app + ".populate")
+                except ImportError:
+                    continue
+
+                if callable(app.populate):
+                    app.populate(*extra_options)
+        if track and tables:
+            run = PopulateLog(settings.BAKE_LOCATION).add_run(tables)
+            print("populate run {0} changed: {1}".format(
+                run, ", ".join(sorted(tables))))
+
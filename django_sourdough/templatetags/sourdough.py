@@ -0,0 +1,53 @@
+'''
+
+{% load sourdough %}
+
+{% bakecache nav %}...{% endbakecache %}
+{% bakecache sidebar area.slug %}...{% endbakecache %}
+
+While baking, the contents are rendered once for each name (and
+values that follow it) and reused on later pages. Outside a bake
+the contents are rendered as normal.
+
+As with django's {% cache %} tag, any value the fragment depends on
+needs to be part of the key.
+
+'''
+
+from django import template
+
+from ..views.bake import BakeView
+from ..views.fragments import fragment_cache
+
+register = template.Library()
+
+
+class BakeCacheNode(template.Node):
+
+    def __init__(self, nodelist, name, vary_on):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        if not BakeView.baking_options.get("baking"):
+            return self.nodelist.render(context)
+        key = (self.name,) + tuple(str(v.resolve(context))
+                                   for v in self.vary_on)
+        value = fragment_cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            fragment_cache.set(key, value)
+        return value
+
+
+@register.tag("bakecache")
+def do_bakecache(parser, token):
+    nodelist = parser.parse(("endbakecache",))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 2:
+        raise template.TemplateSyntaxError(
+            "'{0}' tag requires a fragment name.".format(tokens[0]))
+    vary_on = [parser.compile_filter(t) for t in tokens[2:]]
+    return BakeCacheNode(nodelist, tokens[1].strip("'\""), vary_on)
@@ -1,26 +1,42 @@
 
+import asyncio
 import datetime
 import io
 import os
 import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 
-from dirsync import sync
 from django.conf import settings
 from django.core.handlers.base import BaseHandler
-from django.http import HttpResponse
+from django.http.response import HttpResponseBase
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
 from django.test.client import RequestFactory
-from django.urls import reverse
 
-from .functional import LogicalView
+from .compress import available_encodings, compress_tree
+from .dependencies import (BakeDependencies, PopulateLog, TableRecorder,
+                           record_tables)
+from .fragments import fragment_cache
+from .functional import LogicalView, async_to_sync, sync_to_async
+from .journal import BakeJournal
+from .manifest import BakeManifest
+from .minify import html_minify
+from .output_index import OutputIndex
+from .parallel import chunks
+from .paths import bake_reverse
+from .profiling import BakeProfiler, null_timer
+from .progress import BakeProgress
+from .queries import (BakeQueryLog, QueryCounter, count_queries,
+                      page_recorders, route_queries)
+from .restrict import LimitQuery
+from .static_sync import sync_static
+from .retry import BakeErrorLog, RetryQueue, bake_retries
+from .timings import BakeTimings
+from .writers import BakeWriter, archive_writer
 from .url import AppUrl
 
-try:
-    from htmlmin.minify import html_minify
-except Exception:
-    def html_minify(x): return x
-
 import six
 
 if six.PY2:
@@ -33,9 +49,122 @@ def bake_static():
     """
     syncs the static file location to the bake directory
     """
-    for d in settings.STATICFILES_DIRS:
-        print("syncing {0}".format(d))
-        sync(d, os.path.join(settings.BAKE_LOCATION, "static"), "sync")
+    sync_static(settings.STATICFILES_DIRS,
+                os.path.join(settings.BAKE_LOCATION, "static"),
+                settings.BAKE_LOCATION)
+
+
+_default_writer = BakeWriter()
+
+html_content_types = ["text/html", "application/xhtml+xml"]
+
+
+def _restrict_options(options, limit_query):
+    for x in options:
+        if limit_query.matches(x):
+            yield x
+
+
+def _already_baked(file_path, only_absent=False, only_old=0,
+                   output_index=None):
+    """
+    True if --only_absent or --only_old mean the existing
+    file can be left as it is
+    output_index (an OutputIndex) is used instead of checking the file
+    """
+    if not (only_absent or only_old):
+        return False
+    if output_index is not None:
+        if not output_index.exists(file_path):
+            return False
+        if only_absent:
+            return True
+        t = output_index.mtime(file_path)
+        if t is None:
+            # not known (e.g. written to an archive) - check the file
+            try:
+                t = os.stat(file_path).st_mtime
+            except OSError:
+                return False
+    else:
+        if not os.path.isfile(file_path):
+            return False
+        if only_absent:
+            return True
+        t = os.path.getmtime(file_path)
+    last_modified = datetime.fromtimestamp(t)
+    return last_modified > datetime.now() - timedelta(days=only_old)
+
+
+def _is_streamed(response):
+    """
+    streamed responses, and anything that isn't html, are written
+    as they are - not held in memory or minified
+    """
+    if response.streaming:
+        return True
+    content_type = response.get("Content-Type", "text/html")
+    content_type = content_type.split(";")[0].strip().lower()
+    return content_type not in html_content_types
+
+
+def _response_chunks(response):
+    if response.streaming:
+        return response.streaming_content
+    return [response.content]
+
+
+class FetchedContext(object):
+    """
+    the result of running a view's logic ahead of render_to_file
+    - the context, or the error it raised
+
+    tables (a TableRecorder) and queries (a QueryCounter) hold what
+    the logic queried, if they were being recorded - started and
+    finished are when it ran
+    """
+
+    def __init__(self, request, context=None, error=None, tables=None,
+                 queries=None, started=None, finished=None):
+        self.request = request
+        self.context = context
+        self.error = error
+        self.tables = tables
+        self.queries = queries
+        self.started = started
+        self.finished = finished
+
+    @property
+    def seconds(self):
+        return self.finished - self.started
+
+    def get(self):
+        if self.error is not None:
+            raise self.error
+        return self.context
+
+
+@contextmanager
+def bake_phase(timer, name):
+    """
+    time a phase of rendering a page, and label any error with it
+    """
+    try:
+        with timer.phase(name):
+            yield
+    except Exception as e:
+        if not hasattr(e, "bake_phase"):
+            e.bake_phase = name
+        raise
+
+
+def _worker_options(options, worker, worker_count):
+    worker_threshold = worker
+    if worker == worker_count:
+        worker_threshold = 0
+    for n, x in enumerate(options):
+        if (n + 1) % worker_count == worker_threshold:
+            yield x
 
 
 class BakeView(LogicalView):
@@ -46,6 +175,13 @@ class BakeView(LogicalView):
     expects a bake_args() generator that returns a series
     of different sets of arguments to bake into files.
 
+    set bake_batch_size to group bake_args into batches - each batch
+    is passed to _prepare_batch() before rendering.
+
+    views with async logic fetch the context of up to bake_concurrency
+    (or --concurrency) pages at once in an event loop - rendering and
+    writing stay on the sync thread.
+
     expects a BAKE_LOCATION - in django settings
 
     render_to_file() - render all possible versions of this view.
@@ -54,16 +190,26 @@ class BakeView(LogicalView):
 
     bake_path = ""
     bake_file_type = "html"
+    bake_batch_size = 0
+    bake_concurrency = 20
     baking_options = {"baking": False}
 
     def add_to_error_log(self,
                          bake_location,
                          path,
                          error,
-                         error_log="error_log.txt"):
+                         error_log=None):
         """
         Record errors path with basic information on cause.
+        While baking this goes to the run's BakeErrorLog, otherwise
+        (or if error_log is a file name) a line in a text file.
         """
+        if error_log is None:
+            log = self.baking_options.get("error_log")
+            if isinstance(log, BakeErrorLog):
+                log.add(self.__class__.url_name, path, error)
+                return
+            error_log = "error_log.txt"
         cls_name = self.__class__.__name__
         d = datetime.now().isoformat()
         e_name = type(error).__name__
@@ -78,73 +224,289 @@ class BakeView(LogicalView):
         render all versions of this view into a files
         """
         class_name = cls.url_name
-        verbose_level = kwargs["verbose_level"]
         print("baking {type}".format(type=class_name))
+        # baked on its own - retry and log errors here
+        own_retries = kwargs.get("retry_queue") is None
+        own_log = kwargs.get("error_log") is None
+        own_progress = kwargs.get("progress") is None
+        if own_retries:
+            kwargs["retry_queue"] = RetryQueue.from_options(**kwargs)
+        if own_log:
+            kwargs["error_log"] = BakeErrorLog(settings.BAKE_LOCATION)
+        if own_progress:
+            kwargs["progress"] = BakeProgress.from_options(**kwargs)
+        progress = kwargs["progress"]
+        cls._start_bake(**kwargs)
+        i = cls()
+
+        options, total_to_bake = i.get_bake_options(**kwargs)
+        progress.set_total(class_name, total_to_bake)
+
+        worker_count = kwargs["worker_count"]
+        worker = kwargs["worker"]
+        if worker:
+            print("Processing as worker {0} of {1}".format(
+                worker, worker_count))
+
+        batch_size = cls.bake_batch_size
+        if batch_size:
+            batches = chunks(options, batch_size)
+        elif cls.is_async():
+            # enough to keep the event loop busy
+            batches = chunks(options, i._concurrency(**kwargs) * 4)
+        else:
+            batches = ([o] for o in options)
+
+        for batch in batches:
+            if batch_size:
+                cls._prepare_batch(batch)
+            rendered = i._render_batch(batch, **kwargs)
+            progress.add(class_name, len(batch), rendered)
+
+        if own_retries:
+            bake_retries([cls], **kwargs)
+        if own_log:
+            kwargs["error_log"].close()
+        progress.report(class_name)
+        progress.finish_view(class_name)
+        if own_progress:
+            progress.close()
+        cls._finish_bake(**kwargs)
+
+    @classmethod
+    def _start_bake(cls, **kwargs):
+        """
+        store the bake options against the class and run any
+        preparation - done once per bake, before any worker
+        processes are forked so they inherit the results
+        """
         cls.baking_options.update(kwargs)
         cls.baking_options["baking"] = True
         cls._prepare_bake()
-        i = cls()
+        cls._warm_template()
+
+    @classmethod
+    def _finish_bake(cls, **kwargs):
+        """
+        wait for queued files to be written
+
+        if every page of the view was considered, let the manifest
+        report any previously baked pages that are now missing
+        """
+        if kwargs.get("writer"):
+            kwargs["writer"].flush()
+        manifest = kwargs.get("manifest")
+        if manifest is None or kwargs.get("worker"):
+            return
+        for n in range(1, 11):
+            if kwargs.get("restrict_{0}".format(n)):
+                return
+        manifest.complete_views.add(cls.url_name)
+
+    @classmethod
+    def _warm_template(cls):
+        """
+        load the template once so the compiled version is
+        in the template cache before rendering starts
+        """
+        template_path = cls()._get_template_path()
+        if not template_path:
+            return
+        try:
+            get_template(template_path)
+        except TemplateDoesNotExist:
+            pass
+
+    def _concurrency(self, concurrency=None, **kwargs):
+        return concurrency or self.__class__.bake_concurrency
+
+    def _render_batch(self, options, **kwargs):
+        """
+        render_to_file for each of options - returns the number rendered
+        async views fetch several pages' contexts at once
+        """
+        if self.is_async():
+            # logic runs before render_to_file records the page's queries
+            recording = kwargs.get("dependencies") is not None or \
+                kwargs.get("query_log") is not None
+            with route_queries(recording):
+                return async_to_sync(self._async_render_batch)(options,
+                                                               **kwargs)
+        rendered = 0
+        for o in options:
+            if self.render_to_file(o, **kwargs):
+                rendered += 1
+        return rendered
+
+    async def _async_render_batch(self, options, **kwargs):
+        limit = asyncio.Semaphore(self._concurrency(**kwargs))
+
+        async def bake_page(args):
+            # each page has its own instance - logic sets attributes
+            view = self.__class__()
+            async with limit:
+                view_context = await view._fetch_context(args, **kwargs)
+            return await sync_to_async(view.render_to_file)(
+                args, view_context=view_context, **kwargs)
+
+        results = await asyncio.gather(*[bake_page(o) for o in options])
+        return len([x for x in results if x])
+
+    async def _fetch_context(self, args, **kwargs):
+        """
+        run the view's async logic for these arguments ahead of
+        render_to_file - None if render_to_file will skip the page
+        """
+        if args is None:
+            args = []
+        request = await sync_to_async(self._page_request)(args, **kwargs)
+        if request is None:
+            return None
+        fetched = FetchedContext(request, started=time.time())
+        if kwargs.get("dependencies") is not None:
+            fetched.tables = TableRecorder()
+        if kwargs.get("query_log") is not None:
+            fetched.queries = QueryCounter()
+        with page_recorders(fetched.tables, fetched.queries):
+            try:
+                fetched.context = await self._aget_view_context(request,
+                                                                *args)
+            except Exception as e:
+                fetched.error = e
+        fetched.finished = time.time()
+        return fetched
 
-        func = i.bake_args
-        limit_query = None
+    def _page_request(self, args, **kwargs):
+        """
+        request for these arguments - None if the page will be skipped
+        """
+        file_path, request_path = self._get_bake_paths(*args)
+        if self._will_skip(args, file_path, **kwargs):
+            return None
+        return RequestFactory().get(request_path)
+
+    def _will_skip(self,
+                   args,
+                   file_path,
+                   only_absent=False,
+                   only_old=0,
+                   dependencies=None,
+                   journal=None,
+                   output_index=None,
+                   **kwargs):
+        """
+        True if render_to_file would skip these args without
+        getting the view's context
+        """
+        if journal is not None and journal.done(self.__class__.url_name,
+                                                args):
+            return True
+        if _already_baked(file_path, only_absent, only_old, output_index):
+            return True
+        return dependencies is not None and dependencies.unaffected(file_path)
+
+    def get_bake_options(self, **kwargs):
+        """
+        returns (options, total)
+
+        options lazily iterates through bake_args, reduced by any
+        --restrict_n arguments and split by --worker. Nothing is
+        stored, so bake_args can stream (e.g. queryset.iterator()).
+
+        with --cost_order (and a timing history for this view) options
+        is instead a list, slowest page first, and --worker takes a
+        balanced share of the expected time.
+
+        total is a hint for progress reports - from bake_count(),
+        or the length of bake_args if it returns a list. None if unknown.
+        """
+        limit_query = LimitQuery.from_options(**kwargs)
         if six.PY2:
-            arg_no = len(getargspec(i.bake_args).args)
+            # includes self
+            arg_no = len(getargspec(self.bake_args).args) - 1
         else:
-            arg_no = len(signature(i.bake_args).parameters)
+            arg_no = len(signature(self.bake_args).parameters)
 
-        if arg_no > 1:
-            generator = i.bake_args(limit_query)
+        if arg_no > 0:
+            generator = self.bake_args(limit_query)
         else:
-            generator = i.bake_args()
+            generator = self.bake_args()
 
-        options = list(generator)
+        total = self.bake_count()
+        if total is None and hasattr(generator, "__len__"):
+            total = len(generator)
 
-        if options:
-            # based on --restrict_1, restrict_2 arguments
-            # reduce arguments just to those that match
-            for n in range(1, 11):
-                restrict = kwargs["restrict_{0}".format(n)]
-                if restrict:
-                    options = [
-                        x for x in options if not x or x[n-1] in restrict]
+        options = iter(generator)
 
-        total_to_bake = float(len(options))
+        # based on --restrict_1, restrict_2 arguments
+        # reduce arguments just to those that match
+        # (in case bake_args did not use limit_query)
+        if limit_query:
+            options = _restrict_options(options, limit_query)
 
         # can split the task into different piles for different workers
         worker_count = kwargs["worker_count"]
         worker = kwargs["worker"]
-        if worker:
-            print("Processing as worker {0} of {1}".format(
-                worker, worker_count))
-            worker_threshold = worker
-            if worker == worker_count:
-                worker_threshold = 0
-        step = 20
-        start = datetime.now()
-        process_count = 0
-        alert_template = "{type}: {done} out of {total} ({percent}%) {time}"
-        for n, o in enumerate(options):
-            # divide work into piles and skip those not needed
+
+        timings = kwargs.get("timings")
+        view_name = self.__class__.url_name
+        if kwargs.get("cost_order") and timings is not None \
+                and timings.has_history(view_name):
+            options = timings.cost_order(view_name, options)
             if worker:
-                if (n + 1) % worker_count != worker_threshold:
+                options = timings.balanced_share(view_name, options,
+                                                 worker, worker_count)
+            return options, len(options)
+
+        if worker:
+            options = _worker_options(options, worker, worker_count)
+            if total is not None:
+                total = -(-total // worker_count)
+
+        return options, total
+
+    def plan(self, timings=None, journal=None, **kwargs):
+        """
+        count the pages a bake with these options would render,
+        without rendering them
+
+        returns (pages, to bake, estimated seconds, pages with no
+        timing history) - estimate is None with no history
+        """
+        view_name = self.__class__.url_name
+        only_absent = kwargs.get("only_absent", False)
+        only_old = kwargs.get("only_old", 0)
+        output_index = kwargs.get("output_index")
+        options, _ = self.get_bake_options(timings=timings, **kwargs)
+        pages = 0
+        to_bake = 0
+        seconds = 0.0
+        unknown = 0
+        for o in options:
+            pages += 1
+            if journal is not None and journal.done(view_name, o):
+                continue
+            if only_absent or only_old:
+                file_path = self._get_bake_paths(*(o or []))[0]
+                if _already_baked(file_path, only_absent, only_old,
+                                  output_index):
                     continue
-            process_count += 1
-            if o is None:
-                rendered = i.render_to_file(**kwargs)
-            else:
-                rendered = i.render_to_file(o, **kwargs)
-            if process_count % step == 0 and rendered and verbose_level > 0:
-                end = datetime.now()
-                time_taken = end - start
-                p = round(((n+1)/total_to_bake) * 100, 2)
-                print(alert_template.format(type=class_name,
-                                            done=n+1,
-                                            total=total_to_bake,
-                                            percent=p,
-                                            time=end.isoformat()))
-                print("{step} completed in {time}.".format(
-                    step=step, time=time_taken))
-                start = end
+            to_bake += 1
+            if timings is not None:
+                seconds += timings.estimate(view_name, o)
+                if not timings.known(view_name, o):
+                    unknown += 1
+        if timings is None or not timings.has_history():
+            seconds = None
+        return pages, to_bake, seconds, unknown
+
+    def bake_count(self):
+        """
+        override with a cheap count of what bake_args will produce
+        (e.g. queryset.count()) to get percentages in progress reports
+        when bake_args is a generator
+        """
+        return None
 
     @ classmethod
     def _prepare_bake(self):
@@ -155,6 +517,16 @@ class BakeView(LogicalView):
 
         pass
 
+    @ classmethod
+    def _prepare_batch(cls, batch):
+        """
+        class method - if bake_batch_size is set, called with each
+        batch of bake_args before they are rendered
+         - e.g. in_bulk or prefetch_related the objects for the batch
+        """
+
+        pass
+
     def _get_bake_path(self, *args):
         """
         override to have a more clever way of specifying
@@ -168,20 +540,53 @@ class BakeView(LogicalView):
             else:
                 bake_path = self.__class__.bake_path
         else:
-            rev = reverse(self.__class__.url_name, args=args)[1:]
-            parts = rev.split("/")
-            bake_path = os.path.join(*parts)
-            extension = "." + self.__class__.bake_file_type
-            if bake_path[-len(extension):] == extension:
-                extension = ""
-            if bake_path[-1] in ["/", "\\"]:
-                bake_path += "index" + extension
-            else:
-                bake_path += extension
+            bake_path = self._url_to_bake_path(self._get_bake_url(*args))
 
         return os.path.join(settings.BAKE_LOCATION,
                             bake_path)
 
+    def _get_bake_url(self, *args):
+        """
+        url for these arguments - compiled once rather than
+        using reverse() for each page
+        """
+        check = self.baking_options.get("check_paths", False)
+        return bake_reverse(self.__class__.url_name, args, check)
+
+    def _url_to_bake_path(self, url):
+        """
+        relative file path for a url
+        """
+        parts = url[1:].split("/")
+        bake_path = os.path.join(*parts)
+        extension = "." + self.__class__.bake_file_type
+        if bake_path[-len(extension):] == extension:
+            extension = ""
+        if bake_path == "" or bake_path[-1] in ["/", "\\"]:
+            bake_path += "index" + extension
+        else:
+            bake_path += extension
+        return bake_path
+
+    def _get_bake_paths(self, *args):
+        """
+        returns the file path and the request path to render it with
+        if bake_path or _get_bake_path are customised, the request
+        path is worked out from the file path
+        """
+        cls = self.__class__
+        if cls.bake_path or cls._get_bake_path is not BakeView._get_bake_path:
+            file_path = self._get_bake_path(*args)
+            request_path = file_path.replace(settings.BAKE_LOCATION, "")
+            request_path = request_path.replace(
+                "\\", "/").replace("index.html", "").replace(".html", "")
+            return file_path, request_path
+
+        url = self._get_bake_url(*args)
+        file_path = os.path.join(settings.BAKE_LOCATION,
+                                 self._url_to_bake_path(url))
+        return file_path, url
+
     def render_to_file(self,
                        args=None,
                        only_absent=False,
@@ -189,120 +594,289 @@ class BakeView(LogicalView):
                        skip_errors=False,
                        retry_errors=3,
                        verbose_level=2,
+                       manifest=None,
+                       dependencies=None,
+                       writer=None,
+                       profiler=None,
+                       query_log=None,
+                       retry_queue=None,
+                       error_log=None,
+                       attempt=1,
+                       journal=None,
+                       timings=None,
+                       view_context=None,
+                       output_index=None,
                        **kwargs):
         """
         renders this set of arguments to a files
+
+        if a manifest is passed, files whose content is unchanged
+        are not rewritten
+        if dependencies are passed, the tables read are recorded and
+        pages unaffected by changed tables are skipped
+        writer is the BakeWriter to save the file with
+        profiler is a BakeProfiler to time each phase with
+        query_log is a BakeQueryLog to count each page's queries in
+
+        errors are written to error_log (a BakeErrorLog) and the page
+        put on retry_queue to be tried again after the main pass -
+        attempt is how many times this page has now been tried
+
+        finished pages are added to journal (a BakeJournal) - pages
+        it already holds (with --resume) are skipped straight away
+
+        the time taken to render each page is added to timings
+        (a BakeTimings)
+
+        view_context is a FetchedContext if the view's (async) logic
+        has already been run for these arguments
+
+        output_index is an OutputIndex of the bake location to check
+        --only_absent and --only_old against
         """
         if args is None:
             args = []
 
-        file_path = self._get_bake_path(*args)
+        view_name = self.__class__.url_name
 
-        if only_absent and os.path.isfile(file_path):
+        if journal is not None and journal.done(view_name, args):
+            if manifest:
+                manifest.keep(self._get_bake_paths(*args)[0])
             return False
 
-        if os.path.isfile(file_path) and only_old:
-            t = os.path.getmtime(file_path)
-            last_modified = datetime.fromtimestamp(t)
-            if last_modified > datetime.now() - timedelta(days=only_old):
-                return False
+        timer = profiler.start_page(view_name) if profiler else null_timer
+        if view_context is not None:
+            timer.add_phase("context", view_context.started,
+                            view_context.finished)
 
-        if verbose_level > 1:
+        with timer.phase("path"):
+            file_path, request_path = self._get_bake_paths(*args)
+        timer.path = file_path
+
+        def skipped():
+            if manifest:
+                manifest.keep(file_path)
+            if journal is not None:
+                journal.add(view_name, args)
+            return False
+
+        if _already_baked(file_path, only_absent, only_old, output_index):
+            return skipped()
+
+        if dependencies is not None and dependencies.unaffected(file_path):
+            return skipped()
+
+        if verbose_level > 2:
             print(u"saving {0}".format(file_path))
-        directory = os.path.dirname(file_path)
-        if os.path.isdir(directory) is False:
-            os.makedirs(directory)
-
-        request_path = file_path.replace(settings.BAKE_LOCATION, "")
-        request_path = request_path.replace(
-            "\\", "/").replace("index.html", "").replace(".html", "")
-        request = RequestFactory().get(request_path)
-
-        error_count = 0
-        context = None
-        # error handling, allow repeats or skip
-        while context is None:
-            try:
-                context = self._get_view_context(request, *args)
-            except Exception as e:
-                error_count += 1
-                if error_count < retry_errors:
-                    print("retrying {0}".format(error_count))
-                    time.sleep(5)
-                    pass
+
+        if view_context is not None:
+            request = view_context.request
+        else:
+            request = RequestFactory().get(request_path)
+        start = time.time()
+
+        if writer is None:
+            writer = _default_writer
+        # earlier pages whose queued writes have failed
+        writer.handle_errors()
+
+        def on_error(error):
+            """
+            this page's queued write failed
+            """
+            if manifest:
+                manifest.keep(file_path)
+            self._bake_error(error, args, request_path, attempt,
+                             skip_errors, retry_queue, error_log)
+
+        try:
+            on_written = None
+            if manifest or journal is not None:
+                def on_written(path):
+                    if manifest:
+                        manifest.record(path, view_name)
+                    if journal is not None:
+                        journal.add(view_name, args)
+
+            size = None
+            with record_tables(dependencies is not None) as tables, \
+                    count_queries(query_log is not None) as queries:
+                html = self._bake_content(request, args, timer=timer,
+                                          view_context=view_context)
+                if isinstance(html, HttpResponseBase):
+                    # generated as it is written
+                    with bake_phase(timer, "write"):
+                        size, written = self._write_response(
+                            html, file_path, writer, manifest, on_written)
+                    if not written and journal is not None:
+                        journal.add(view_name, args)
+
+            if view_context is not None:
+                # queries made by the logic, fetched ahead of this
+                if view_context.tables is not None:
+                    tables.update(view_context.tables.tables)
+                if view_context.queries is not None:
+                    queries.merge(view_context.queries)
+
+            if html is None or html is False:
+                skipped()
+                return html
+
+            if dependencies is not None:
+                dependencies.record(file_path, tables)
+
+            if query_log is not None:
+                if size is None:
+                    size = len(html)
+                query_log.add_page(view_name, file_path, queries, size)
+
+            if timings is not None:
+                seconds = time.time() - start
+                if view_context is not None:
+                    seconds += view_context.seconds
+                timings.add(view_name, args, seconds)
+
+            if isinstance(html, HttpResponseBase):
+                timer.finish()
+                return True
+
+            unchanged = False
+            with bake_phase(timer, "write"):
+                if manifest:
+                    unchanged = manifest.unchanged(file_path, html, view_name,
+                                                   on_disk=writer.writes_files)
+                if unchanged and writer.writes_files:
+                    writer.ensure_compressed(file_path, html)
+                    if journal is not None:
+                        journal.add(view_name, args)
                 else:
-                    self.add_to_error_log(settings.BAKE_LOCATION,
-                                          request_path,
-                                          e
-                                          )
-                    if not skip_errors:
-                        raise e
-                    else:
-                        error_notice = "suppressing error: {0} - {1}"
-                        e_name = type(e).__name__
-                        print(
-                            error_notice.format(e_name, e))
-                        break
-        if not context:
+                    writer.write(file_path, html, on_written, on_error)
+        except Exception as e:
+            if manifest:
+                manifest.keep(file_path)
+            return self._bake_error(e, args, request_path, attempt,
+                                    skip_errors, retry_queue, error_log)
+
+        timer.finish()
+        return True
+
+    def _bake_error(self,
+                    error,
+                    args,
+                    path,
+                    attempt=1,
+                    skip_errors=False,
+                    retry_queue=None,
+                    error_log=None):
+        """
+        record an error, and queue the page to be tried again later
+        if it has attempts left
+        returns None, or raises the error if the page has failed
+        and errors are not being skipped
+        """
+        view_name = self.__class__.url_name
+        e_name = type(error).__name__
+        retry = retry_queue is not None and not retry_queue.is_final(attempt)
+        if error_log is None:
+            self.add_to_error_log(settings.BAKE_LOCATION, path, error)
+        else:
+            error_log.add(view_name, path, error, args,
+                          getattr(error, "bake_phase", ""), attempt, retry)
+        if retry:
+            delay = retry_queue.add(view_name, args, attempt + 1)
+            print("{0} on {1} - retrying in {2}s".format(e_name, path, delay))
             return None
+        if not skip_errors:
+            raise error
+        error_notice = "suppressing error: {0} - {1}"
+        print(error_notice.format(e_name, error))
+        return None
 
-        banned_types = ['text/csv']
+    def _write_response(self,
+                        response,
+                        file_path,
+                        writer,
+                        manifest=None,
+                        on_written=None):
+        """
+        write a streamed (or non-html) response chunk by chunk
+        returns (size, written) - written is False if the manifest
+        shows the file is unchanged
+        """
+        view_name = self.__class__.url_name
+        unchanged = None
+        if manifest:
+            def unchanged(digest):
+                return manifest.unchanged_hash(file_path, digest, view_name,
+                                               on_disk=writer.writes_files)
+        try:
+            return writer.write_stream(file_path, _response_chunks(response),
+                                       on_written, unchanged)
+        finally:
+            response.close()
+
+    def _bake_content(self, request, args, timer=null_timer,
+                      view_context=None):
+        """
+        get the rendered content for these arguments
+        returns None if the view had no context, False if there was
+        no result - or the response itself if it is streamed or not
+        html, to be written without minifying
+        errors are raised with the phase they happened in
+        as error.bake_phase
+        """
+        with bake_phase(timer, "context"):
+            if view_context is None:
+                context = self._get_view_context(request, *args)
+            else:
+                context = view_context.get()
+        if not context:
+            return None
 
         # if a valid response has already been 
         # generated by some layer of the structure
 
-        if isinstance(context, HttpResponse):
-            html = html_minify(context.content)
-            if context["Content-Type"] not in banned_types:
-                html = html.replace(
-                    "<html><head></head><body>", "")
-                html = html.replace("</body></html>", "")
+        if isinstance(context, HttpResponseBase):
+            if _is_streamed(context):
+                # written as it is, a chunk at a time
+                return context
+            with bake_phase(timer, "minify"):
+                html = html_minify(context.content)
+            html = html.replace(
+                "<html><head></head><body>", "")
+            html = html.replace("</body></html>", "")
         else:
             # normal case, we give the context to a view
-            error_count = 0
-            result = None
-            # error handling, allow repeats or skip
-            while result is None:
-                try:
-                    result = self.context_to_html(request, context)
-                except Exception as e:
-                    error_count += 1
-                    if error_count < retry_errors:
-                        print("retrying {0}".format(error_count))
-                        time.sleep(5)
-                        pass
-                    else:
-                        if not skip_errors:
-                            raise e
-                        else:
-                            e_name = type(e).__name__
-                            error_notice = "suppressing error: {0} - {1}"
-                            print(
-                                error_notice.format(e_name, e))
-                            break
+            with bake_phase(timer, "render"):
+                result = self.context_to_html(request, context)
 
             if not result:
                 return False
 
-            html = html_minify(result.content)
+            with bake_phase(timer, "minify"):
+                html = html_minify(result.content)
 
-        if type(html) == bytes:
-            with io.open(file_path, "wb") as f:
-                f.write(html)
-        else:
-            with io.open(file_path, "w", encoding="utf-8") as f:
-                f.write(html)
-
-        return True
+        return html
 
     @ classmethod
     def write_file(cls, args, path, minimise=True):
         """
         more multi-purpose writer - accepts path argument
+        streamed and non-html responses are written a chunk at a time
         """
         request = RequestFactory().get(path)
-        content = cls.as_view(decorators=False)(
-            request, *args).content
+        view = cls.as_view(decorators=False)
+        if cls.is_async():
+            view = async_to_sync(view)
+        response = view(request, *args)
+        if _is_streamed(response):
+            print(u"writing {0}".format(path))
+            try:
+                _default_writer.write_stream(path, _response_chunks(response))
+            finally:
+                response.close()
+            return
+        content = response.content
         if b"<html" in content and minimise:
             content = html_minify(content)
         if type(content) == bytes:
@@ -315,10 +889,42 @@ class BakeView(LogicalView):
         """
         subclass with a generator that feeds
         all possible arguments into the view
+
+        limit_query is a LimitQuery built from --restrict_n
+        (or None) that can be applied to the query
         """
         return [None]
 
 
+class BakeRun(object):
+    """
+    reports shared by every app baked in one run of the bake command,
+    so each covers the whole run rather than just the last app baked
+    saved once every app has been baked
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self._to_save = []
+
+    def get(self, name, factory, save=True):
+        """
+        the run's object for name in the current bake location -
+        made by factory() the first time it is asked for
+        """
+        key = (name, str(settings.BAKE_LOCATION))
+        if key not in self.objects:
+            self.objects[key] = factory()
+            if save:
+                self._to_save.append(key)
+        return self.objects[key]
+
+    def save(self):
+        for key in self._to_save:
+            self.objects[key].save()
+        self._to_save = []
+
+
 class BaseBakeManager(object):
     """
     Manager for bake command function
@@ -343,12 +949,80 @@ class BaseBakeManager(object):
             return os.path.join(settings.BAKE_LOCATION, "static")
 
     def copy_static_files(self):
-        for d in [settings.STATIC_ROOT]:
-            dir_loc = self.get_static_destination()
-            print("syncing {0}".format(d))
-            if os.path.isdir(dir_loc) is False:
-                os.makedirs(dir_loc)
-            sync(d, dir_loc, "sync")
+        """
+        --static_mode and --static_delete set how files are synced
+        """
+        sync_static([settings.STATIC_ROOT],
+                    self.get_static_destination(),
+                    settings.BAKE_LOCATION,
+                    self.arg_options.get("static_mode", "copy"),
+                    self.arg_options.get("static_delete", False),
+                    max(self.arg_options.get("write_threads", 0), 8))
+        self.compress_static_files()
+
+    def compress_static_files(self):
+        """
+        --precompress also writes .gz/.br versions of static files
+        """
+        precompress = self.arg_options.get("precompress")
+        if precompress:
+            compress_tree(self.get_static_destination(),
+                          available_encodings(precompress),
+                          self.arg_options.get("precompress_min_size", 1024),
+                          max(self.arg_options.get("write_threads", 0), 4))
+
+    def get_dependencies(self, options):
+        """
+        --track_dependencies records the tables each page reads
+        --changed_since also skips pages unaffected by populate runs
+        since that run
+        """
+        changed_since = options.get("changed_since")
+        if changed_since:
+            log = PopulateLog(settings.BAKE_LOCATION)
+            changed = log.tables_changed_since(changed_since)
+            print("tables changed since {0}: {1}".format(
+                changed_since, ", ".join(sorted(changed))))
+            return BakeDependencies(settings.BAKE_LOCATION, changed)
+        if options.get("track_dependencies"):
+            return BakeDependencies(settings.BAKE_LOCATION)
+        return None
+
+    def get_writer(self, options):
+        """
+        --archive writes into a zip, tar or pack file
+        otherwise loose files in the bake location
+        """
+        if options.get("archive"):
+            return archive_writer(options["archive"], settings.BAKE_LOCATION)
+        return BakeWriter(options.get("write_threads", 0),
+                          options.get("fsync", "none"),
+                          options.get("precompress"),
+                          options.get("precompress_min_size", 1024))
+
+    def get_output_index(self, options, manifest=None):
+        """
+        --only_absent and --only_old check a listing of the bake
+        location made once, rather than each file
+        """
+        if not (options.get("only_absent") or options.get("only_old")):
+            return None
+        source = options.get("output_index") or "scan"
+        if source == "none":
+            return None
+        if source == "manifest":
+            if manifest is None:
+                manifest = BakeManifest(settings.BAKE_LOCATION)
+            index = OutputIndex.from_manifest(settings.BAKE_LOCATION,
+                                              manifest)
+        else:
+            threads = max(options.get("write_threads", 0), 8)
+            index = OutputIndex.scan(settings.BAKE_LOCATION,
+                                     mtimes=bool(options.get("only_old")),
+                                     threads=threads)
+        print("{0} files already in the bake location ({1})".format(
+            len(index), source))
+        return index
 
     def amend_settings(self, **kwargs):
         pass
@@ -356,14 +1030,120 @@ class BaseBakeManager(object):
     def bake_app(self):
         self.app_urls.bake(**self.arg_options)
 
+    def plan(self, options):
+        """
+        --plan - print what a bake with these options would do
+        """
+        self.arg_options = options
+        if self.app_urls and self.app_urls.has_bakeable_views():
+            self.amend_settings()
+            journal = None
+            if options.get("resume"):
+                journal = BakeJournal(settings.BAKE_LOCATION, resume=True,
+                                      worker=options.get("worker", 0))
+            timings = BakeTimings(settings.BAKE_LOCATION)
+            output_index = self.get_output_index(options)
+            self.app_urls.plan(**dict(options,
+                                      timings=timings,
+                                      journal=journal,
+                                      output_index=output_index))
+
     def bake(self, options):
         """
         this is the main function
         """
         self.arg_options = options
+        if options.get("plan"):
+            self.plan(options)
+            return
+        if options.get("worker"):
+            # each worker would save a manifest of only its own share
+            for k in ["only_changed", "track_dependencies", "changed_since"]:
+                if options.get(k):
+                    raise ValueError("--{0} can't be used with "
+                                     "--worker".format(k))
         if self.app_urls and self.app_urls.has_bakeable_views():
             self.amend_settings()
             self.create_bake_dir()
             if options["skip_static"] is False:
                 self.copy_static_files()
-            self.bake_app()
+            # the bake command shares one run between apps
+            run = options.get("bake_run")
+            own_run = run is None
+            if own_run:
+                run = BakeRun()
+            manifest = None
+            if options.get("only_changed"):
+                manifest = run.get("manifest", lambda: BakeManifest(
+                    settings.BAKE_LOCATION))
+            dependencies = self.get_dependencies(options)
+            writer = self.get_writer(options)
+            output_index = self.get_output_index(options, manifest)
+            if output_index is not None and output_index.directories:
+                writer.known_directories(output_index.directories)
+            profiler = None
+            if options.get("profile") or options.get("profile_trace"):
+                profiler = run.get("profiler", lambda: BakeProfiler(
+                    settings.BAKE_LOCATION,
+                    trace=options.get("profile_trace"),
+                    worker=options.get("worker", 0)))
+            query_log = None
+            if options.get("count_queries"):
+                query_log = run.get("query_log", lambda: BakeQueryLog(
+                    settings.BAKE_LOCATION, options.get("worker", 0)))
+            fragment_cache.clear()
+            error_log = BakeErrorLog(settings.BAKE_LOCATION)
+            journal = None
+            resume = options.get("resume")
+            if resume and writer.resumable is False:
+                print("--resume can't add to an existing zip or tar archive "
+                      "- baking everything")
+                resume = False
+            # a coordinated bake keeps its progress in the queue
+            if not options.get("coordinate"):
+                journal = run.get("journal", lambda: BakeJournal(
+                    settings.BAKE_LOCATION, resume=resume,
+                    worker=options.get("worker", 0)), save=False)
+            timings = BakeTimings(settings.BAKE_LOCATION,
+                                  options.get("worker", 0))
+            if options.get("cost_order") and not timings.has_history():
+                print("no bake_timings.json yet - --cost_order takes "
+                      "effect from the next bake")
+            retry_queue = RetryQueue.from_options(**options)
+            progress = BakeProgress.from_options(error_log=error_log,
+                                                 retry_queue=retry_queue,
+                                                 **options)
+            self.arg_options = dict(options,
+                                    manifest=manifest,
+                                    dependencies=dependencies,
+                                    writer=writer,
+                                    profiler=profiler,
+                                    query_log=query_log,
+                                    fragment_cache=fragment_cache,
+                                    retry_queue=retry_queue,
+                                    error_log=error_log,
+                                    journal=journal,
+                                    timings=timings,
+                                    progress=progress,
+                                    output_index=output_index)
+            try:
+                self.bake_app()
+            finally:
+                # if the bake stops, keep a record of the pages finished
+                # so far for --resume
+                try:
+                    writer.close()
+                finally:
+                    error_log.close()
+                    if journal:
+                        journal.close()
+                    # {% bakecache %} only caches while baking
+                    BakeView.baking_options["baking"] = False
+            progress.close()
+            fragment_cache.report()
+            fragment_cache.clear()
+            timings.save()
+            if own_run:
+                run.save()
+            if dependencies:
+                dependencies.save()
@@ -0,0 +1,131 @@
+'''
+
+Precompressed .gz and .br siblings for baked and static files,
+for static hosts that serve precompressed files directly.
+
+'br' needs the brotli (or brotlicffi) package - without it only
+gzip versions are written.
+
+'''
+
+import gzip
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+encodings = ["gz", "br"]
+
+# static files worth compressing
+compressible_extensions = [".html", ".htm", ".css", ".js", ".mjs", ".json",
+                           ".svg", ".xml", ".txt", ".csv", ".map", ".ico",
+                           ".geojson", ".topojson", ".md"]
+
+
+def available_encodings(requested):
+    """
+    reduce requested encodings to those that can be produced
+    """
+    available = []
+    for e in requested:
+        if e not in encodings:
+            raise ValueError("Unknown encoding {0}".format(e))
+        if e == "br" and brotli is None:
+            print("brotli not installed - skipping .br files")
+            continue
+        available.append(e)
+    return available
+
+
+def compress(content, encoding):
+    if encoding == "gz":
+        return gzip.compress(content, compresslevel=9, mtime=0)
+    if encoding == "br":
+        return brotli.compress(content, quality=9)
+    raise ValueError("Unknown encoding {0}".format(encoding))
+
+
+def write_compressed(file_path, content, encodings, only_missing=False):
+    """
+    write file_path.gz etc for content (bytes or str)
+    if only_missing, existing siblings are left alone
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    for e in encodings:
+        path = file_path + "." + e
+        if only_missing and os.path.exists(path):
+            continue
+        with open(path, "wb") as f:
+            f.write(compress(content, e))
+
+
+def compress_file(file_path, encodings, only_missing=False,
+                  chunk_size=1 << 16):
+    """
+    write file_path.gz etc by reading file_path a chunk at a time
+    - for files too large to hold in memory
+    """
+    for e in encodings:
+        path = file_path + "." + e
+        if only_missing and os.path.exists(path):
+            continue
+        with open(file_path, "rb") as src, open(path, "wb") as dest:
+            if e == "gz":
+                with gzip.GzipFile(filename="", mode="wb", fileobj=dest,
+                                   compresslevel=9, mtime=0) as z:
+                    shutil.copyfileobj(src, z, chunk_size)
+            elif e == "br":
+                compressor = brotli.Compressor(quality=9)
+                for chunk in iter(lambda: src.read(chunk_size), b""):
+                    dest.write(compressor.process(chunk))
+                dest.write(compressor.finish())
+            else:
+                raise ValueError("Unknown encoding {0}".format(e))
+
+
+def _compress_if_stale(file_path, encodings):
+    """
+    compress a file if any sibling is missing or older than it
+    returns True if anything was written
+    """
+    mtime = os.path.getmtime(file_path)
+    stale = []
+    for e in encodings:
+        path = file_path + "." + e
+        if os.path.exists(path) is False or os.path.getmtime(path) < mtime:
+            stale.append(e)
+    if not stale:
+        return False
+    with open(file_path, "rb") as f:
+        write_compressed(file_path, f.read(), stale)
+    return True
+
+
+def compress_tree(directory, encodings, min_size=1024, threads=4):
+    """
+    compress all compressible files in a directory (e.g. static files)
+    files unchanged since their siblings were written are skipped
+    """
+    to_compress = []
+    for root, dirs, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in compressible_extensions:
+                continue
+            path = os.path.join(root, name)
+            if os.path.getsize(path) >= min_size:
+                to_compress.append(path)
+
+    with ThreadPoolExecutor(max(threads, 1)) as executor:
+        results = list(executor.map(lambda x: _compress_if_stale(x, encodings),
+                                    to_compress))
+    print("compressed {0} of {1} files in {2}".format(sum(results),
+                                                     len(to_compress),
+                                                     directory))
@@ -0,0 +1,428 @@
+'''
+
+Bake across several machines (or processes) from one shared queue.
+
+--coordinate PATH points every worker at the same SQLite file on
+shared storage (or a local file for several processes on one machine).
+The first worker to arrive fills the queue with batches of bake_args
+for every view. All workers - including that one once it has
+finished filling - lease batches from the queue, bake them (with a
+local --jobs pool if set) and mark them done.
+
+A lease lasts --lease seconds. A batch whose lease has run out (the
+worker died, or is very slow) is handed to the next worker that asks,
+so idle workers steal the work of stalled ones. If both finish a
+batch it is just baked twice.
+
+Pages that error are put back in the queue as batches of their own,
+with their attempt number and a time they can be retried after
+(--retry_backoff), so any worker can retry them and none are lost if
+the worker that found the error stops.
+
+Each worker records its progress in the queue (batches, pages, pages
+rendered, last seen) - see --coordinate_status.
+
+Each set of views (each app given to the bake command) is filled and
+finished separately within the queue, so one queue can hold several
+apps. The queue file holds the state of one bake - restarted workers
+carry on where they left off. Use a new path (or delete the file) to start
+a new bake. bake_args must be json serialisable (strings, numbers) to
+go through the queue.
+
+'''
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from .parallel import bake_in_pool, can_fork, ordered_chunks
+from .retry import RetryQueue, bake_retries
+
+schema = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    view TEXT,
+    options TEXT,
+    count INTEGER,
+    status TEXT DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    leases INTEGER DEFAULT 0,
+    rendered INTEGER DEFAULT 0,
+    attempt INTEGER DEFAULT 1,
+    ready REAL
+);
+CREATE INDEX IF NOT EXISTS batches_status ON batches (status);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started REAL,
+    last_seen REAL,
+    batches INTEGER DEFAULT 0,
+    pages INTEGER DEFAULT 0,
+    rendered INTEGER DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class WorkQueue(object):
+
+    def __init__(self, path, worker_name=None, lease=600.0, views=None):
+        """
+        views - names of the views this worker is baking. Filling and
+        finishing are tracked for each set of views, and only batches
+        for these views are claimed.
+        """
+        self.path = path
+        self.lease = lease
+        if not worker_name:
+            worker_name = "{0}-{1}".format(socket.gethostname(), os.getpid())
+        self.worker_name = worker_name
+        self.views = sorted(views) if views else None
+        self.scope = ",".join(self.views) if self.views else ""
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._pid != os.getpid():
+            self._connection = sqlite3.connect(self.path,
+                                               timeout=60,
+                                               isolation_level=None,
+                                               check_same_thread=False)
+            self._connection.executescript(schema)
+            self._pid = os.getpid()
+        return self._connection
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            db = self._connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+
+    def _get_meta(self, db, key):
+        row = db.execute("SELECT value FROM meta WHERE key = ?",
+                         (self._meta_key(key),)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, db, key, value):
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                   (self._meta_key(key), value))
+
+    def _meta_key(self, key):
+        return "{0}:{1}".format(key, self.scope)
+
+    def _view_filter(self):
+        """
+        sql condition (and params) limiting batches to this worker's views
+        """
+        if not self.views:
+            return "1", []
+        marks = ", ".join("?" for v in self.views)
+        return "view IN ({0})".format(marks), list(self.views)
+
+    def claim_filling(self):
+        """
+        True if this worker should fill the queue
+        """
+        with self.transaction() as db:
+            self._register(db)
+            if self._get_meta(db, "state") is not None:
+                return False
+            self._set_meta(db, "state", "filling")
+            self._set_meta(db, "filler", self.worker_name)
+            self._set_meta(db, "heartbeat", str(time.time()))
+            return True
+
+    def add_batches(self, batches):
+        """
+        batches is a list of (view name, options)
+        """
+        rows = []
+        for view_name, b in batches:
+            try:
+                rows.append((view_name, json.dumps(b), len(b)))
+            except TypeError:
+                raise TypeError("--coordinate needs bake_args that can be "
+                                "stored as json ({0})".format(view_name))
+        with self.transaction() as db:
+            db.executemany("INSERT INTO batches (view, options, count) "
+                           "VALUES (?, ?, ?)", rows)
+            self._set_meta(db, "heartbeat", str(time.time()))
+
+    def heartbeat(self):
+        with self.transaction() as db:
+            self._set_meta(db, "heartbeat", str(time.time()))
+
+    def add_retry(self, view_name, args, attempt, ready):
+        """
+        put a page back in the queue to be tried again after ready
+        """
+        try:
+            options = json.dumps([args])
+        except TypeError:
+            raise TypeError("--coordinate needs bake_args that can be "
+                            "stored as json ({0})".format(view_name))
+        with self.transaction() as db:
+            db.execute("INSERT INTO batches (view, options, count, attempt, "
+                       "ready) VALUES (?, ?, 1, ?, ?)",
+                       (view_name, options, attempt, ready))
+
+    def finish_filling(self):
+        with self.transaction() as db:
+            self._set_meta(db, "state", "filled")
+
+    def _register(self, db):
+        now = time.time()
+        db.execute("INSERT OR IGNORE INTO workers (name, host, pid, started) "
+                   "VALUES (?, ?, ?, ?)",
+                   (self.worker_name, socket.gethostname(), os.getpid(), now))
+        db.execute("UPDATE workers SET last_seen = ? WHERE name = ?",
+                   (now, self.worker_name))
+
+    def claim(self):
+        """
+        lease the next pending batch (retries once they are ready),
+        or one whose lease has run out
+        returns (batch id, view name, options, attempt) or None
+        """
+        now = time.time()
+        views, params = self._view_filter()
+        with self.transaction() as db:
+            self._register(db)
+            row = db.execute("SELECT id, view, options, attempt FROM batches "
+                             "WHERE ((status = 'pending' "
+                             "AND (ready IS NULL OR ready <= ?)) "
+                             "OR (status = 'leased' AND lease_until < ?)) "
+                             "AND " + views + " "
+                             "ORDER BY status = 'leased', id LIMIT 1",
+                             [now, now] + params).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE batches SET status = 'leased', worker = ?, "
+                       "lease_until = ?, leases = leases + 1 WHERE id = ?",
+                       (self.worker_name, now + self.lease, row[0]))
+        return row[0], row[1], json.loads(row[2]), row[3]
+
+    def complete(self, batch_id, count, rendered):
+        with self.transaction() as db:
+            db.execute("UPDATE batches SET status = 'done', worker = ?, "
+                       "rendered = ? WHERE id = ?",
+                       (self.worker_name, rendered, batch_id))
+            self._register(db)
+            db.execute("UPDATE workers SET batches = batches + 1, "
+                       "pages = pages + ?, rendered = rendered + ? "
+                       "WHERE name = ?",
+                       (count, rendered, self.worker_name))
+
+    def is_finished(self):
+        """
+        True once the queue is filled and every batch is done
+        raises an error if the worker filling the queue has stopped
+        """
+        with self.transaction() as db:
+            state = self._get_meta(db, "state")
+            if state == "filling":
+                heartbeat = float(self._get_meta(db, "heartbeat") or 0)
+                if time.time() - heartbeat > self.lease:
+                    raise RuntimeError("{0} stopped before the queue was "
+                                       "filled - start a new queue".format(
+                                           self._get_meta(db, "filler")))
+                return False
+            if state is None:
+                return False
+            views, params = self._view_filter()
+            row = db.execute("SELECT COUNT(*) FROM batches "
+                             "WHERE status != 'done' AND " + views,
+                             params).fetchone()
+            return row[0] == 0
+
+    def status(self):
+        db = self._connect()
+        batches = dict(db.execute("SELECT status, COUNT(*) FROM batches "
+                                  "GROUP BY status").fetchall())
+        # retries are pages already counted
+        pages = db.execute("SELECT COALESCE(SUM(count), 0) FROM batches "
+                           "WHERE attempt = 1").fetchone()[0]
+        workers = db.execute("SELECT name, host, pid, last_seen, batches, "
+                             "pages, rendered FROM workers "
+                             "ORDER BY name").fetchall()
+        states = db.execute("SELECT value FROM meta "
+                            "WHERE key LIKE 'state:%'").fetchall()
+        states = set(x[0] for x in states)
+        state = None
+        if states:
+            state = "filling" if "filling" in states else "filled"
+        return {"state": state,
+                "batches": batches,
+                "pages": pages,
+                "workers": workers}
+
+    def print_status(self):
+        status = self.status()
+        b = status["batches"]
+        print("queue {0}: {1} pages, batches {2} pending, {3} leased, "
+              "{4} done".format(status["state"], status["pages"],
+                                b.get("pending", 0), b.get("leased", 0),
+                                b.get("done", 0)))
+        template = "{0} ({1} pid {2}): {4} batches, {5} pages, " \
+                   "{6} rendered, last seen {3}"
+        for w in status["workers"]:
+            w = list(w)
+            if w[3]:
+                w[3] = datetime.fromtimestamp(w[3]).isoformat()
+            print(template.format(*w))
+
+
+class SharedRetryQueue(RetryQueue):
+    """
+    a RetryQueue that puts pages back in the shared queue rather than
+    keeping them in this worker - so it never has items of its own
+    """
+
+    def __init__(self, work_queue, retry_errors=3, backoff=5.0,
+                 backoff_max=300.0):
+        super(SharedRetryQueue, self).__init__(retry_errors, backoff,
+                                               backoff_max)
+        self.work_queue = work_queue
+
+    @classmethod
+    def from_options(cls, work_queue, **kwargs):
+        return cls(work_queue,
+                   kwargs.get("retry_errors", 3),
+                   kwargs.get("retry_backoff", 5.0),
+                   kwargs.get("retry_backoff_max", 300.0))
+
+    def add(self, view_name, args, attempt):
+        delay = self.delay(attempt)
+        self.work_queue.add_retry(view_name, args, attempt,
+                                  time.time() + delay)
+        return delay
+
+
+@contextmanager
+def keep_alive(queue):
+    """
+    refresh the filling heartbeat while the block runs - reading
+    bake_args (all of them first, with --cost_order) can take longer
+    than the lease
+    """
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(max(queue.lease / 4, 1.0)):
+            queue.heartbeat()
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def fill_queue(queue, views, chunk_size=20, **kwargs):
+    pending = []
+    with keep_alive(queue):
+        for view_index, chunk in ordered_chunks(views, chunk_size, **kwargs):
+            pending.append((views[view_index].url_name, chunk))
+            if len(pending) == 100:
+                queue.add_batches(pending)
+                pending = []
+        if pending:
+            queue.add_batches(pending)
+    queue.finish_filling()
+
+
+def queue_chunks(queue, views, poll=2.0):
+    """
+    (view index, chunk, attempt, on_done) for batches leased from the
+    queue until every batch is done
+    """
+    indexes = {v.url_name: n for n, v in enumerate(views)}
+    while True:
+        claimed = queue.claim()
+        if claimed:
+            batch_id, view_name, options, attempt = claimed
+            if view_name not in indexes:
+                raise ValueError("{0} is in the queue but is not being "
+                                 "baked here".format(view_name))
+
+            def on_done(count, rendered, batch_id=batch_id):
+                queue.complete(batch_id, count, rendered)
+            yield indexes[view_name], options, attempt, on_done
+            continue
+        if queue.is_finished():
+            return
+        time.sleep(poll)
+
+
+def bake_coordinated(views, chunk_size=20, **kwargs):
+    """
+    bake views as one of the workers sharing a --coordinate queue
+    """
+    for k in ["only_changed", "track_dependencies", "changed_since"]:
+        if kwargs.get(k):
+            raise ValueError("--{0} can't be used with --coordinate".format(k))
+    queue = WorkQueue(kwargs["coordinate"],
+                      kwargs.get("worker_name"),
+                      kwargs.get("lease", 600.0),
+                      [v.url_name for v in views])
+    print("coordinated bake as {0}".format(queue.worker_name))
+    # pages with errors go back into the shared queue
+    kwargs["retry_queue"] = SharedRetryQueue.from_options(queue, **kwargs)
+    for v in views:
+        print("preparing {0}".format(v.url_name))
+        v._start_bake(**kwargs)
+
+    if queue.claim_filling():
+        fill_queue(queue, views, chunk_size, **kwargs)
+
+    source = queue_chunks(queue, views)
+    if kwargs.get("jobs", 1) > 1 and can_fork():
+        bake_in_pool(views, chunk_size, source=source, **kwargs)
+    else:
+        progress = kwargs.get("progress")
+        writer = kwargs.get("writer")
+        instances = {}
+        for view_index, options, attempt, on_done in source:
+            v = views[view_index]
+            if view_index not in instances:
+                instances[view_index] = v()
+            i = instances[view_index]
+            if v.bake_batch_size:
+                v._prepare_batch(options)
+            rendered = i._render_batch(options, attempt=attempt, **kwargs)
+            if writer is not None:
+                # failed writes are put back in the queue before the
+                # batch is done
+                writer.flush()
+            on_done(len(options), rendered)
+            if progress is not None:
+                if attempt > 1:
+                    # already counted as processed
+                    options = []
+                progress.add(v.url_name, len(options), rendered)
+        bake_retries(views, **kwargs)
+        for v in views:
+            v._finish_bake(**kwargs)
+            if progress is not None:
+                progress.finish_view(v.url_name)
+    queue.print_status()
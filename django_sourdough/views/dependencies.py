@@ -0,0 +1,155 @@
+'''
+
+Track which database tables each baked page reads, and which tables
+each populate run writes to, so a later bake can re-render only the
+pages affected by a data update.
+
+Tables are picked out of the SQL run on the connection through
+django's execute_wrapper hook. Dependencies are table level - a change
+to any row in a table re-renders every page that read from it.
+
+bake_dependencies.json - relative path -> tables read
+populate_log.json - list of populate runs and the tables they wrote
+
+'''
+
+import json
+import os
+import re
+from contextlib import ExitStack, contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+table_pattern = re.compile(r'\b(?:FROM|JOIN|INTO|UPDATE)\s+["`\[]?(\w+)',
+                           re.IGNORECASE)
+write_statements = ("INSERT", "UPDATE", "DELETE", "REPLACE", "TRUNCATE")
+
+
+class TableRecorder(object):
+    """
+    execute_wrapper that notes the tables used by each query
+    if writes_only, ignores SELECT queries
+    """
+
+    def __init__(self, writes_only=False):
+        self.writes_only = writes_only
+        self.tables = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.writes_only is False or sql.lstrip().upper().startswith(write_statements):
+            self.tables.update(table_pattern.findall(sql))
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def record_tables(active=True, writes_only=False):
+    """
+    yields a set that collects the tables used on all
+    connections inside the block
+    """
+    recorder = TableRecorder(writes_only)
+    if active is False:
+        yield recorder.tables
+        return
+    with ExitStack() as stack:
+        for c in connections.all():
+            stack.enter_context(c.execute_wrapper(recorder))
+        yield recorder.tables
+
+
+class BakeDependencies(object):
+    """
+    relative path -> tables read when rendering that page
+
+    if changed_tables is set, pages that only read from other
+    tables are unaffected and can be skipped
+    """
+
+    filename = "bake_dependencies.json"
+
+    def __init__(self, bake_location, changed_tables=None):
+        self.bake_location = bake_location
+        self.changed_tables = changed_tables
+        self.pages = {}
+        self._updates = {}
+        path = Path(bake_location, self.filename)
+        if path.exists():
+            with open(path) as f:
+                self.pages = json.load(f)
+
+    def relative(self, file_path):
+        return os.path.relpath(file_path, self.bake_location).replace("\\", "/")
+
+    def unaffected(self, file_path):
+        """
+        True if this page's recorded inputs have not changed
+        """
+        if self.changed_tables is None:
+            return False
+        tables = self.pages.get(self.relative(file_path))
+        if tables is None or os.path.isfile(file_path) is False:
+            return False
+        return self.changed_tables.isdisjoint(tables)
+
+    def record(self, file_path, tables):
+        rel = self.relative(file_path)
+        tables = sorted(tables)
+        self.pages[rel] = tables
+        self._updates[rel] = tables
+
+    def pop_updates(self):
+        updates = self._updates
+        self._updates = {}
+        return updates
+
+    def merge(self, updates):
+        self.pages.update(updates)
+
+    def save(self):
+        with open(Path(self.bake_location, self.filename), "w") as f:
+            json.dump(self.pages, f, separators=(",", ":"))
+
+
+class PopulateLog(object):
+    """
+    list of populate runs and the tables each one wrote to
+    stored in the bake directory
+    """
+
+    filename = "populate_log.json"
+
+    def __init__(self, bake_location=None):
+        if bake_location is None:
+            bake_location = settings.BAKE_LOCATION
+        self.path = Path(bake_location, self.filename)
+        self.runs = []
+        if self.path.exists():
+            with open(self.path) as f:
+                self.runs = json.load(f)
+
+    def add_run(self, tables):
+        run = {"run": datetime.now().isoformat(timespec="seconds"),
+               "tables": sorted(tables)}
+        self.runs.append(run)
+        if self.path.parent.exists() is False:
+            os.makedirs(self.path.parent)
+        with open(self.path, "w") as f:
+            json.dump(self.runs, f, indent=1)
+        return run["run"]
+
+    def tables_changed_since(self, run):
+        """
+        tables written by the given run and all later runs
+        'last' gives only the most recent run
+        """
+        if run == "last":
+            runs = self.runs[-1:]
+        else:
+            runs = [x for x in self.runs if x["run"] >= run]
+        tables = set()
+        for r in runs:
+            tables.update(r["tables"])
+        return tables
@@ -0,0 +1,80 @@
+'''
+
+FragmentCache - rendered template fragments kept for the length of a
+bake, used by the {% bakecache %} tag (django_sourdough.templatetags).
+
+The cache is per process - with --jobs each worker fills its own copy
+and shares it between all the views it bakes. Hits and misses from
+workers are passed back to the parent for the end of bake summary.
+
+BAKE_FRAGMENT_CACHE_SIZE sets how many fragments are kept (least
+recently used fragments are dropped first).
+
+'''
+
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class FragmentCache(object):
+
+    default_size = 1024
+
+    def __init__(self):
+        self.fragments = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    @property
+    def max_size(self):
+        return getattr(settings, "BAKE_FRAGMENT_CACHE_SIZE", self.default_size)
+
+    def get(self, key):
+        with self._lock:
+            value = self.fragments.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.fragments.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self.fragments[key] = value
+            self.fragments.move_to_end(key)
+            while len(self.fragments) > self.max_size:
+                self.fragments.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self.fragments.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def pop_updates(self):
+        """
+        counts since last called - passed from pool workers to the parent
+        """
+        with self._lock:
+            updates = {"hits": self.hits, "misses": self.misses}
+            self.hits = 0
+            self.misses = 0
+        return updates
+
+    def merge(self, updates):
+        with self._lock:
+            self.hits += updates["hits"]
+            self.misses += updates["misses"]
+
+    def report(self):
+        total = self.hits + self.misses
+        if total:
+            print("fragment cache: {0} hits, {1} misses ({2}%)".format(
+                self.hits, self.misses, round(self.hits / float(total) * 100, 1)))
+
+
+fragment_cache = FragmentCache()
@@ -4,6 +4,9 @@ Created on 26 Mar 2016
 @author: alex
 '''
 
+import asyncio
+
+from django.core.exceptions import ImproperlyConfigured
 from django.shortcuts import render
 from django.http.response import HttpResponse
 from django.shortcuts import HttpResponseRedirect
@@ -11,9 +14,23 @@ from .exceptions import RedirectException
 
 from useful_decorator import GenericDecorator
 
+try:
+    from asgiref.sync import async_to_sync, sync_to_async
+except ImportError:
+    # django before 3.0 - async logic is not available
+    async_to_sync = sync_to_async = None
+
 
 def handle_redirect(func):
 
+    if asyncio.iscoroutinefunction(func):
+        async def inner(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except RedirectException as new_url:
+                return HttpResponseRedirect(str(new_url))
+        return inner
+
     def inner(*args, **kwargs):
         try:
             return func(*args, **kwargs)
@@ -23,6 +40,16 @@ def handle_redirect(func):
     return inner
 
 
+async def run_hook(func):
+    """
+    await an async function, or run a sync one on the sync thread
+    (where it can use the ORM)
+    """
+    if asyncio.iscoroutinefunction(func):
+        return await func()
+    return await sync_to_async(func)()
+
+
 class FunctionalView(object):
     """
     Very simple class-based view that simple expects the class to have a 
@@ -58,7 +85,22 @@ class FunctionalView(object):
                 # if we're returning a redirect view
                 return context
 
+        async def async_render_func(request, *args, **kwargs):
+
+            view = cls()
+
+            context = await view._aget_view_context(request, *args, **kwargs)
+
+            if isinstance(context, dict):
+                context = view.extra_params(context)
+                return await sync_to_async(view.context_to_html)(request,
+                                                                 context)
+            else:
+                return context
+
         func = render_func
+        if cls.is_async():
+            func = async_render_func
         func = handle_redirect(func)  # allow RedirectException
         if decorators:
             for v in cls.view_decorators:
@@ -66,13 +108,44 @@ class FunctionalView(object):
 
         return func
 
+    @classmethod
+    def is_async(cls):
+        """
+        True if the view has async logic - served as an async view
+        and baked several pages at a time
+        """
+        if "_is_async" not in cls.__dict__:
+            is_async = cls._has_async_logic()
+            if is_async and sync_to_async is None:
+                raise ImproperlyConfigured(
+                    "{0} has async logic - needs django 3.1+".format(
+                        cls.__name__))
+            cls._is_async = is_async
+        return cls._is_async
+
+    @classmethod
+    def _has_async_logic(cls):
+        return asyncio.iscoroutinefunction(cls.view)
+
     def _get_view_context(self, request, *args, **kwargs):
+        if self.is_async():
+            return async_to_sync(self._aget_view_context)(request, *args,
+                                                          **kwargs)
         context = self.view(request, *args, **kwargs)
 
         if isinstance(context, dict):
             context = self.extra_params(context)
         return context
 
+    async def _aget_view_context(self, request, *args, **kwargs):
+        context = self.view(request, *args, **kwargs)
+        if asyncio.iscoroutine(context):
+            context = await context
+
+        if isinstance(context, dict):
+            context = self.extra_params(context)
+        return context
+
     def extra_params(self, context):
         return context
 
@@ -109,6 +182,10 @@ class LogicalView(FunctionalView):
     Lower order have priority.
     Default order is 5.
 
+    logic (and pre and postlogic functions) can be async - the view
+    is then an async view. Any sync functions alongside them are run
+    on the sync thread, so can use the ORM.
+
     """
 
     args = []
@@ -153,6 +230,9 @@ class LogicalView(FunctionalView):
         for k, v in kwargs.items():
             setattr(self, k, v)
 
+        if self.is_async():
+            return self._async_view()
+
          # returning a HTTP response or redirect early iterates up
         prelogic = self._prelogic()
         if prelogic:
@@ -166,33 +246,41 @@ class LogicalView(FunctionalView):
 
         return {k: getattr(self, k) for k in self.values}
 
+    async def _async_view(self):
+        prelogic = await self._async_logic_processing("prelogic")
+        if prelogic:
+            return prelogic
+        logic = await run_hook(self.logic)
+        if logic:
+            return logic
+        postlogic = await self._async_logic_processing("postlogic")
+        if postlogic:
+            return postlogic
+
+        return {k: getattr(self, k) for k in self.values}
+
+    @classmethod
+    def _has_async_logic(cls):
+        funcs = [cls.logic]
+        funcs += _logic_functions(cls, "prelogic")
+        funcs += _logic_functions(cls, "postlogic")
+        return any(asyncio.iscoroutinefunction(f) for f in funcs)
+
     def _logic_processing(self, prefix):
         """
         run all pre and post logic functions in order.
         """
-        def keying(v):
-            if hasattr(v, "order"):
-                return v.order
-            else:
-                return 5
-
-        def ga(k):
-            return getattr(self, k)
-        """
-        has a function had either a decorator or a name prefix assigned to it
-        """
-        def passes_func_test(k): return hasattr(
-            k, "_prefix") and k._prefix == prefix
-
-        def passes_test(k): return prefix + "_" in k or passes_func_test(ga(k))
-        funcs = [k for k in dir(self) if passes_test(k)]
-        funcs = [ga(k) for k in funcs]
-        funcs.sort(key=lambda x: keying(x))
-        for f in funcs:
+        for f in _logic_functions(self, prefix):
             r = f()
             if r:  # if any value is returned, escalate
                 return r
 
+    async def _async_logic_processing(self, prefix):
+        for f in _logic_functions(self, prefix):
+            r = await run_hook(f)
+            if r:  # if any value is returned, escalate
+                return r
+
     def _prelogic(self):
         return self._logic_processing("prelogic")
 
@@ -207,6 +295,31 @@ class LogicalView(FunctionalView):
         return None
 
 
+def _logic_functions(obj, prefix):
+    """
+    pre or post logic functions of a view (or view class) in order
+    """
+    def keying(v):
+        if hasattr(v, "order"):
+            return v.order
+        else:
+            return 5
+
+    def ga(k):
+        return getattr(obj, k)
+    """
+    has a function had either a decorator or a name prefix assigned to it
+    """
+    def passes_func_test(k): return hasattr(
+        k, "_prefix") and k._prefix == prefix
+
+    def passes_test(k): return prefix + "_" in k or passes_func_test(ga(k))
+    funcs = [k for k in dir(obj) if passes_test(k)]
+    funcs = [ga(k) for k in funcs]
+    funcs.sort(key=lambda x: keying(x))
+    return funcs
+
+
 class prelogic(GenericDecorator):
     """
     decorates a function to run before the logic view
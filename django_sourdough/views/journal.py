@@ -0,0 +1,107 @@
+'''
+
+BakeJournal - an append-only record of the (view, args) items a bake
+has finished, so a bake that dies part way through can be picked up
+again with --resume.
+
+An item is added once its file has been written (or it was skipped
+or unchanged) - pages that errored are not added. Items are buffered
+and appended in batches, so a crash loses at most the last batch
+(those pages are baked again on resume).
+
+Each process appends to its own file, so pool workers (or several
+machines sharing the bake location) never write to the same file.
+The files are kept in bake_dir/bake_journal/all/ - or worker-N/ for
+a bake with --worker N, so concurrent workers keep separate journals.
+A bake without --resume starts a new journal (once per bake command,
+not for each app), clearing only its own directory.
+
+'''
+
+import json
+import os
+import shutil
+import socket
+import threading
+from pathlib import Path
+
+
+def item_key(args):
+    if not args:
+        return "[]"
+    return json.dumps([str(x) for x in args])
+
+
+class BakeJournal(object):
+
+    directory = "bake_journal"
+    batch_size = 500
+
+    def __init__(self, bake_location, resume=False, worker=0):
+        if worker:
+            name = "worker-{0}".format(worker)
+        else:
+            name = "all"
+        self.path = Path(bake_location, self.directory, name)
+        self.completed = set()
+        self._pending = []
+        self._pid = None
+        self._file = None
+        self._lock = threading.Lock()
+        if resume:
+            self.load()
+        else:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def load(self):
+        if self.path.exists() is False:
+            return
+        for part in self.path.glob("*.jsonl"):
+            with open(part) as f:
+                for line in f:
+                    try:
+                        view_name, key = json.loads(line)
+                    except ValueError:
+                        # partly written last line
+                        continue
+                    self.completed.add((view_name, key))
+        print("resuming - {0} items already baked".format(len(self.completed)))
+
+    def done(self, view_name, args):
+        return (view_name, item_key(args)) in self.completed
+
+    def add(self, view_name, args):
+        line = json.dumps([view_name, item_key(args)]) + "\n"
+        with self._lock:
+            self._pending.append(line)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+
+    def _open(self):
+        """
+        own file for each process - reopened after a fork
+        """
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self.path.mkdir(parents=True, exist_ok=True)
+            name = "{0}-{1}.jsonl".format(socket.gethostname(), self._pid)
+            self._file = open(Path(self.path, name), "a")
+        return self._file
+
+    def _flush(self):
+        if self._pending:
+            f = self._open()
+            f.write("".join(self._pending))
+            f.flush()
+            self._pending = []
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self.flush()
+        if self._file and self._pid == os.getpid():
+            self._file.close()
+        self._file = None
+        self._pid = None
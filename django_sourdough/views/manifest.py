@@ -0,0 +1,168 @@
+'''
+
+BakeManifest - record a content hash for every baked file so that
+unchanged pages are not rewritten (and keep their modified time).
+
+Stored as bake_manifest.json in the bake directory. After a bake the
+paths that were added, changed or removed are written to
+bake_changes.json - suitable for feeding into an upload step.
+
+'''
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+
+def content_hasher():
+    """
+    for hashing content that arrives in chunks - update() with each
+    """
+    return hashlib.blake2b(digest_size=16)
+
+
+def content_hash(content):
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    hasher = content_hasher()
+    hasher.update(content)
+    return hasher.hexdigest()
+
+
+class BakeManifest(object):
+    """
+    path -> [content hash, mtime_ns, view name] for baked files.
+    paths are stored relative to the bake location.
+    """
+
+    filename = "bake_manifest.json"
+    changes_filename = "bake_changes.json"
+
+    def __init__(self, bake_location):
+        self.bake_location = bake_location
+        self.previous = {}
+        self.current = {}
+        self.added = set()
+        self.changed = set()
+        self.complete_views = set()
+        self._pending = {}
+        self._updates = {}
+        self.load()
+
+    def load(self):
+        path = Path(self.bake_location, self.filename)
+        if path.exists():
+            with open(path) as f:
+                self.previous = json.load(f)
+
+    def relative(self, file_path):
+        return os.path.relpath(file_path, self.bake_location).replace("\\", "/")
+
+    def unchanged(self, file_path, content, view_name="", on_disk=True):
+        """
+        True if the file on disk already holds this content.
+        The file's mtime must match the manifest, so files changed
+        outside of a manifest bake are always rewritten.
+
+        on_disk is False when writing to an archive - only the
+        content hash is compared.
+        """
+        return self.unchanged_hash(file_path, content_hash(content),
+                                   view_name, on_disk)
+
+    def unchanged_hash(self, file_path, digest, view_name="", on_disk=True):
+        """
+        as unchanged, for content already hashed (e.g. as it was
+        streamed to a temporary file)
+        """
+        rel = self.relative(file_path)
+        old = self.previous.get(rel)
+        if old and old[0] == digest:
+            mtime = None
+            if on_disk:
+                try:
+                    mtime = os.stat(file_path).st_mtime_ns
+                except OSError:
+                    # missing - an entry from an archive bake has no
+                    # mtime to compare either
+                    pass
+            if on_disk is False or (mtime is not None and mtime == old[1]):
+                self._set(rel, [digest, mtime, view_name])
+                return True
+        self._pending[rel] = digest
+        return False
+
+    def record(self, file_path, view_name=""):
+        """
+        record a file after it has been written
+        """
+        rel = self.relative(file_path)
+        digest = self._pending.pop(rel, None)
+        if digest is None:
+            # unchanged, but written to an archive
+            return
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        self._set(rel, [digest, mtime, view_name])
+        if rel in self.previous:
+            self.changed.add(rel)
+        else:
+            self.added.add(rel)
+
+    def keep(self, file_path):
+        """
+        file was skipped (only_absent, errors) - keep previous entry
+        """
+        rel = self.relative(file_path)
+        if rel in self.previous:
+            self._set(rel, self.previous[rel])
+
+    def _set(self, rel, entry):
+        self.current[rel] = entry
+        self._updates[rel] = entry
+
+    def pop_updates(self):
+        """
+        entries and changes since last called - passed back from
+        pool workers to the parent process
+        """
+        updates = {"entries": self._updates,
+                   "added": [x for x in self._updates if x in self.added],
+                   "changed": [x for x in self._updates if x in self.changed]}
+        self._updates = {}
+        return updates
+
+    def merge(self, updates):
+        self.current.update(updates["entries"])
+        self.added.update(updates["added"])
+        self.changed.update(updates["changed"])
+
+    def removed(self):
+        """
+        previous paths of fully baked views that were not baked this time
+        """
+        return sorted(k for k, v in self.previous.items()
+                      if k not in self.current and v[2] in self.complete_views)
+
+    def save(self):
+        removed = self.removed()
+        entries = dict(self.previous)
+        entries.update(self.current)
+        for r in removed:
+            del entries[r]
+
+        with open(Path(self.bake_location, self.filename), "w") as f:
+            json.dump(entries, f, separators=(",", ":"))
+
+        changes = {"added": sorted(self.added),
+                   "changed": sorted(self.changed),
+                   "removed": removed}
+        with open(Path(self.bake_location, self.changes_filename), "w") as f:
+            json.dump(changes, f, indent=1)
+
+        print("{0} added, {1} changed, {2} removed".format(len(self.added),
+                                                           len(self.changed),
+                                                           len(removed)))
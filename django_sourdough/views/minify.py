@@ -0,0 +1,156 @@
+'''
+
+Minifier backends for baked pages - chosen with the BAKE_MINIFIER
+setting:
+
+"htmlmin" (default) - django-htmlmin. Parses each page into a tree
+    with BeautifulSoup/html5lib. Not minified if it is not installed.
+"sourdough" - built in streaming minifier. Works on the bytes of the
+    page with a single regex pass and no tree.
+"none" - pages are not minified.
+
+or a dotted path to (or a) function taking bytes/str and returning str.
+
+The built in minifier follows htmlmin's whitespace rules:
+
+- comments are removed (conditional comments are kept)
+- pre, script and textarea contents are left alone
+- runs of whitespace in text become one space
+- whitespace at the edges of text is removed, unless the text is next
+  to an inline element (a, span, em...) where it is kept as one space
+
+Unlike htmlmin it does not rewrite the markup itself - tags,
+attributes and entities are passed through as written, and fragments
+are not wrapped in <html><body>. Text either side of a removed comment
+is treated as one piece of text ("a <!-- x --> b" keeps its space,
+htmlmin gives "ab").
+
+'''
+
+import re
+
+import six
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# elements that are part of a flow of text (as htmlmin)
+inline_tags = {
+    b"a", b"em", b"strong", b"small", b"s", b"cite", b"q", b"dfn", b"abbr",
+    b"data", b"time", b"code", b"var", b"samp", b"kbd", b"sup", b"sub",
+    b"i", b"b", b"u", b"mark", b"ruby", b"rt", b"rp", b"bdi", b"bdo",
+    b"span", b"br", b"wbr", b"ins", b"del",
+}
+
+# a tag starts with a name, /, ! or ? and may have > inside quoted
+# attribute values - any other < is text
+markup = re.compile(rb"<!--.*?-->"
+                    rb"|<(pre|script|textarea)\b.*?</\1\s*>"
+                    rb"|<[a-zA-Z/!?][^>\"']*(?:(?:\"[^\"]*\"|'[^']*')[^>\"']*)*>",
+                    re.DOTALL | re.IGNORECASE)
+tag_name = re.compile(rb"<(/?)([a-zA-Z][a-zA-Z0-9-]*)")
+conditional_comment = re.compile(rb"<!--\[if .*\]>.*<!\[endif\]-->", re.DOTALL)
+conditional_space = re.compile(rb"(\]>)\s+|\s+(<!\[endif\])")
+whitespace = re.compile(rb"\s+")
+
+
+def _flow(tag):
+    """
+    (closes an inline element, opens an inline element) for a tag
+    """
+    m = tag_name.match(tag)
+    if m is None or m.group(2).lower() not in inline_tags:
+        return False, False
+    if m.group(1):
+        return True, False
+    name = m.group(2).lower()
+    return name in (b"br", b"wbr"), True
+
+
+def _text(text, prev_flow, next_flow):
+    text = whitespace.sub(b" ", text)
+    if text == b" ":
+        return b" " if prev_flow and next_flow else b""
+    if not prev_flow and text.startswith(b" "):
+        text = text[1:]
+    if not next_flow and text.endswith(b" "):
+        text = text[:-1]
+    return text
+
+
+def sourdough_minify(content):
+    """
+    streaming minifier - see module docstring
+    """
+    if isinstance(content, six.text_type):
+        content = content.encode("utf-8")
+    parts = []
+    text = b""
+    position = 0
+    prev_flow = False
+    for m in markup.finditer(content):
+        token = m.group(0)
+        text += content[position:m.start()]
+        position = m.end()
+        closes_flow, opens_flow = False, False
+        if token.startswith(b"<!--"):
+            if conditional_comment.match(token) is None:
+                # removed - text either side is joined up
+                continue
+            token = conditional_space.sub(rb"\1\2", whitespace.sub(b" ", token))
+        elif m.group(1) is None:
+            closes_flow, opens_flow = _flow(token)
+        if text:
+            parts.append(_text(text, prev_flow, opens_flow))
+            text = b""
+        parts.append(token)
+        prev_flow = closes_flow
+    text += content[position:]
+    if text:
+        parts.append(_text(text, prev_flow, False))
+    return b"".join(parts).decode("utf-8", errors="ignore")
+
+
+def no_minify(content):
+    if isinstance(content, bytes):
+        content = content.decode("utf-8", errors="ignore")
+    return content
+
+
+def _htmlmin():
+    try:
+        from htmlmin.minify import html_minify
+    except Exception:
+        print("htmlmin not available - pages will not be minified "
+              "(set BAKE_MINIFIER to 'sourdough' to use the built in minifier)")
+        return no_minify
+    return html_minify
+
+
+backends = {"htmlmin": _htmlmin,
+            "sourdough": lambda: sourdough_minify,
+            "none": lambda: no_minify}
+
+_minifiers = {}
+
+
+def get_minifier(name=None):
+    """
+    function for a backend name (default BAKE_MINIFIER)
+    """
+    if name is None:
+        name = getattr(settings, "BAKE_MINIFIER", "htmlmin")
+    if callable(name):
+        return name
+    if name not in _minifiers:
+        if name in backends:
+            _minifiers[name] = backends[name]()
+        else:
+            _minifiers[name] = import_string(name)
+    return _minifiers[name]
+
+
+def html_minify(content):
+    """
+    minify with the current BAKE_MINIFIER backend
+    """
+    return get_minifier()(content)
@@ -0,0 +1,114 @@
+'''
+
+OutputIndex - a listing of the files already in the bake location,
+made once at the start of a bake.
+
+--only_absent and --only_old decide whether to skip each page from
+the index rather than checking its file (isfile, getmtime) one at a
+time - on network storage these checks can take longer than baking
+the pages that are actually missing.
+
+--output_index sets where the listing comes from:
+
+scan - (default) walk the bake location with os.scandir, a directory
+per thread. Modified times are only read for --only_old. The writer
+is also told which directories already exist.
+manifest - the paths and modified times in bake_manifest.json (from
+--only_changed bakes) without touching the disk. Files changed or
+deleted outside of a manifest bake are not noticed.
+none - check each file as it comes up
+
+'''
+
+import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+output_index_sources = ["scan", "manifest", "none"]
+
+
+def _scan_directory(path, value):
+    """
+    files (path -> value(entry), or None) and subdirectories
+    of one directory
+    """
+    files = {}
+    directories = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(entry.path)
+                elif entry.is_file():
+                    files[entry.path] = value(entry) if value else None
+    except FileNotFoundError:
+        pass
+    return files, directories
+
+
+def scan_tree(root, value=None, threads=8):
+    """
+    (files, directories) under root, listing a directory per thread
+    files maps each path to value(entry) - e.g. a stat - or None
+    """
+    root = os.path.normpath(root)
+    files = {}
+    directories = set()
+    if not os.path.isdir(root):
+        return files, directories
+    directories.add(root)
+    with ThreadPoolExecutor(threads) as pool:
+        pending = {pool.submit(_scan_directory, root, value)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                found, subdirectories = future.result()
+                files.update(found)
+                for d in subdirectories:
+                    directories.add(d)
+                    pending.add(pool.submit(_scan_directory, d, value))
+    return files, directories
+
+
+def _mtime(entry):
+    return entry.stat().st_mtime
+
+
+class OutputIndex(object):
+
+    def __init__(self, root):
+        self.root = os.path.normpath(root)
+        self.files = {}
+        self.directories = set()
+
+    @classmethod
+    def scan(cls, root, mtimes=False, threads=8):
+        """
+        list every file under root - mtimes for --only_old
+        """
+        index = cls(root)
+        index.files, index.directories = scan_tree(
+            index.root, _mtime if mtimes else None, threads)
+        return index
+
+    @classmethod
+    def from_manifest(cls, root, manifest):
+        """
+        from a BakeManifest's entries from the last bake
+        """
+        index = cls(root)
+        for rel, entry in manifest.previous.items():
+            mtime = entry[1] / 1e9 if entry[1] is not None else None
+            index.files[os.path.join(index.root, os.path.normpath(rel))] = mtime
+        return index
+
+    def __len__(self):
+        return len(self.files)
+
+    def exists(self, file_path):
+        return os.path.normpath(file_path) in self.files
+
+    def mtime(self, file_path):
+        """
+        modified time (as os.path.getmtime) - None if not known
+        """
+        return self.files.get(os.path.normpath(file_path))
@@ -0,0 +1,235 @@
+'''
+
+Bake several views with a pool of forked worker processes.
+
+All views are prepared (_prepare_bake, template loading) in the parent
+process before the pool is forked, so workers inherit any precached
+objects. The parent then walks the bake_args of every view and feeds
+chunks of them into one shared queue that all workers pull from.
+
+Pages that error are passed back to the parent on its retry queue
+(with the worker's error log records). Once every view has been
+queued and the pool is idle, ready retries are sent back out to the
+pool until none are left.
+
+'''
+
+import multiprocessing
+import threading
+
+from django.db import connections
+
+from .progress import BakeProgress
+
+# set before the pool forks - inherited by the workers
+_pool_views = []
+_pool_options = {}
+_pool_instances = {}
+
+# run wide records that workers pass back to the parent
+collected_options = ["manifest", "dependencies", "profiler", "query_log",
+                     "fragment_cache", "retry_queue", "error_log", "timings"]
+
+
+def can_fork():
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+def _bake_chunk(chunk):
+    """
+    render a chunk of bake_args for one view inside a worker
+    if the view has a bake_batch_size, the chunk is one batch
+    attempt is above 1 for chunks of retries
+    """
+    view_index, options, attempt = chunk
+    if view_index not in _pool_instances:
+        _pool_instances[view_index] = _pool_views[view_index]()
+    i = _pool_instances[view_index]
+    if i.bake_batch_size:
+        i._prepare_batch(options)
+    rendered = i._render_batch(options, attempt=attempt, **_pool_options)
+    if _pool_options.get("writer"):
+        _pool_options["writer"].flush()
+    if _pool_options.get("journal"):
+        _pool_options["journal"].flush()
+    updates = {}
+    for k in collected_options:
+        if _pool_options.get(k) is not None:
+            updates[k] = _pool_options[k].pop_updates()
+    return view_index, attempt, len(options), rendered, updates
+
+
+def chunks(options, size):
+    chunk = []
+    for o in options:
+        chunk.append(o)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _view_chunks(views, chunk_size=20, **kwargs):
+    progress = kwargs.get("progress")
+    for view_index, v in enumerate(views):
+        print("queuing {0}".format(v.url_name))
+        options, total = v().get_bake_options(**kwargs)
+        if progress is not None:
+            progress.set_total(v.url_name, total)
+        size = v.bake_batch_size or chunk_size
+        for chunk in chunks(options, size):
+            yield view_index, chunk
+
+
+def ordered_chunks(views, chunk_size=20, **kwargs):
+    """
+    (view index, chunk of bake_args) for every view
+    with --cost_order, every view is read first and the chunks
+    expected to take longest come first
+    """
+    source = _view_chunks(views, chunk_size, **kwargs)
+    timings = kwargs.get("timings")
+    if kwargs.get("cost_order") and timings is not None \
+            and timings.has_history():
+        return timings.order_chunks(views, source)
+    return source
+
+
+def view_chunks(views, chunk_size=20, **kwargs):
+    """
+    (view index, chunk of bake_args, attempt, on_done) for every view
+    """
+    for view_index, chunk in ordered_chunks(views, chunk_size, **kwargs):
+        yield view_index, chunk, 1, None
+
+
+def bake_in_pool(views, chunk_size=20, source=None, **kwargs):
+    """
+    bake all views using a pool of --jobs worker processes
+
+    source is an iterable of (view index, chunk, attempt, on_done) to bake
+    instead of every view's bake_args - the views must already be
+    started. on_done (if not None) is called with the count of the
+    chunk and how many were rendered once it has been baked.
+    """
+    jobs = kwargs["jobs"]
+    own_progress = kwargs.get("progress") is None
+    if own_progress:
+        kwargs["progress"] = BakeProgress.from_options(**kwargs)
+    progress = kwargs["progress"]
+    if source is None:
+        for v in views:
+            print("preparing {0}".format(v.url_name))
+            v._start_bake(**kwargs)
+        progress.expect(v.url_name for v in views)
+        source = view_chunks(views, chunk_size, **kwargs)
+
+    _pool_views[:] = views
+    _pool_options.clear()
+    _pool_options.update(kwargs)
+
+    # workers must open their own database connections
+    connections.close_all()
+    if kwargs.get("journal"):
+        kwargs["journal"].flush()
+
+    context = multiprocessing.get_context("fork")
+    pool = context.Pool(jobs)
+    print("baking with {0} jobs".format(jobs))
+
+    # limit chunks waiting in the queue
+    slot_count = jobs * 2
+    slots = threading.BoundedSemaphore(slot_count)
+    failures = []
+    totals = {n: [0, 0] for n in range(len(views))}
+
+    def finished(result, on_done=None):
+        view_index, attempt, count, rendered, updates = result
+        for k, v in updates.items():
+            kwargs[k].merge(v)
+        if on_done is not None:
+            on_done(count, rendered)
+        view_totals = totals[view_index]
+        view_totals[1] += rendered
+        # retries were already counted as processed
+        if attempt > 1:
+            count = 0
+        view_totals[0] += count
+        progress.add(views[view_index].url_name, count, rendered)
+        slots.release()
+
+    def failed(error):
+        failures.append(error)
+        slots.release()
+
+    def submit(view_index, chunk, attempt=1, on_done=None):
+        pool.apply_async(_bake_chunk, ((view_index, chunk, attempt),),
+                         callback=lambda r: finished(r, on_done),
+                         error_callback=failed)
+
+    def wait_idle():
+        for n in range(slot_count):
+            slots.acquire()
+        for n in range(slot_count):
+            slots.release()
+
+    view_indexes = {v.url_name: n for n, v in enumerate(views)}
+    retry_queue = kwargs.get("retry_queue")
+    source = iter(source)
+    try:
+        while True:
+            # take the next chunk only once there is room for it
+            slots.acquire()
+            chunk = None
+            if not failures:
+                chunk = next(source, None)
+            if chunk is None:
+                slots.release()
+                break
+            view_index, options, attempt, on_done = chunk
+            submit(view_index, options, attempt, on_done)
+        wait_idle()
+        while retry_queue is not None and len(retry_queue) and not failures:
+            for (view_name, attempt), options in retry_queue.wait().items():
+                view_index = view_indexes[view_name]
+                print("retrying {0} {1} (attempt {2})".format(len(options),
+                                                              view_name,
+                                                              attempt))
+                size = views[view_index].bake_batch_size or chunk_size
+                for chunk in chunks(options, size):
+                    slots.acquire()
+                    if failures:
+                        slots.release()
+                        break
+                    submit(view_index, chunk, attempt)
+            wait_idle()
+        if failures:
+            pool.terminate()
+        else:
+            pool.close()
+        pool.join()
+    except BaseException:
+        pool.terminate()
+        raise
+
+    if failures:
+        raise failures[0]
+
+    for v in views:
+        v._finish_bake(**kwargs)
+        progress.finish_view(v.url_name)
+    if own_progress:
+        progress.close()
+
+    summary = "{name}: {done} processed, {rendered} rendered, {errors} errors"
+    error_log = kwargs.get("error_log")
+    for view_index, v in enumerate(views):
+        done, rendered = totals[view_index]
+        errors = 0
+        if error_log is not None:
+            errors = error_log.failures.get(v.url_name, 0)
+        print(summary.format(name=v.url_name,
+                             done=done,
+                             rendered=rendered,
+                             errors=errors))
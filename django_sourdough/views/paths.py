@@ -0,0 +1,99 @@
+'''
+
+Compiled reverse() for baking.
+
+reverse() searches every pattern registered for a url name and runs
+its regex against each candidate url. When baking the same view
+hundreds of thousands of times that work is repeated for every page.
+
+URLFormatter takes the format string django's resolver has already
+built for the url name, and fills it in directly. Formatters are
+compiled once per url name and number of arguments.
+
+If a url name has more than one pattern for the same number of
+arguments, the regex is needed to choose - these fall back to reverse().
+
+The urlconf and script prefix are read when a formatter is compiled,
+and assumed not to change during a bake (clear_formatters() resets).
+
+With --check_paths every compiled url is compared against reverse().
+
+'''
+
+import re
+from urllib.parse import quote
+
+from django.urls import get_resolver, get_script_prefix, get_urlconf, reverse
+from django.utils.encoding import iri_to_uri
+from django.utils.http import RFC3986_SUBDELIMS, escape_leading_slashes
+
+_formatters = {}
+
+# characters quote() would leave alone
+_needs_quoting = re.compile(r"[^A-Za-z0-9_.\-~/!$&'()*+,;=:@]")
+
+
+class URLFormatter(object):
+    """
+    formats the url for one url name and number of positional arguments
+    """
+
+    def __init__(self, format_string, params, converters):
+        self.format_string = format_string
+        self.params = params
+        self.converters = converters
+
+    def format(self, args):
+        subs = {}
+        for k, v in zip(self.params, args):
+            if k in self.converters:
+                subs[k] = self.converters[k].to_url(v)
+            else:
+                subs[k] = str(v)
+        url = self.format_string % subs
+        if _needs_quoting.search(url):
+            url = iri_to_uri(quote(url, safe=RFC3986_SUBDELIMS + '/~:@'))
+        return escape_leading_slashes(url)
+
+
+def clear_formatters():
+    _formatters.clear()
+
+
+def compile_formatter(url_name, arg_count):
+    """
+    returns a URLFormatter, or None if reverse() must be used
+    """
+    prefix = get_script_prefix()
+    resolver = get_resolver(get_urlconf())
+    found = []
+    for possibility, pattern, defaults, converters in resolver.reverse_dict.getlist(url_name):
+        for result, params in possibility:
+            if len(params) == arg_count:
+                format_string = prefix.replace('%', '%%') + result
+                found.append(URLFormatter(format_string, params, converters))
+    if len(found) == 1:
+        return found[0]
+    return None
+
+
+def bake_reverse(url_name, args, check=False):
+    """
+    reverse() using a compiled formatter where possible
+    if check, the result is compared against reverse()
+    """
+    key = (url_name, len(args))
+    try:
+        formatter = _formatters[key]
+    except KeyError:
+        formatter = _formatters[key] = compile_formatter(*key)
+    if formatter is None:
+        return reverse(url_name, args=args)
+
+    url = formatter.format(args)
+    if check:
+        expected = reverse(url_name, args=args)
+        if url != expected:
+            message = "compiled path {0} does not match reverse() {1}"
+            raise ValueError(message.format(url, expected))
+    return url
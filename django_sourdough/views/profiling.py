@@ -0,0 +1,218 @@
+'''
+
+BakeProfiler - times each phase of every baked page:
+
+path - working out the file and request path
+context - _get_view_context (the view's logic)
+render - context_to_html (the template)
+minify - html_minify
+write - handing the page to the writer (with --write_threads this
+        is only the time to queue it)
+
+Timings are aggregated per view (page count, pages/sec, p50/p95/p99,
+time in each phase, slowest pages) and written to bake_profile.json
+in the bake directory. Optionally every phase is also written as a
+Chrome trace (bake_trace.json - open in chrome://tracing or Perfetto).
+
+'''
+
+import heapq
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+phases = ["path", "context", "render", "minify", "write"]
+
+
+class NullTimer(object):
+    """
+    used when not profiling
+    """
+    path = ""
+
+    @contextmanager
+    def phase(self, name):
+        yield
+
+    def add_phase(self, name, start, end):
+        pass
+
+    def finish(self):
+        pass
+
+
+null_timer = NullTimer()
+
+
+class PageTimer(object):
+
+    def __init__(self, profiler, view_name):
+        self.profiler = profiler
+        self.view_name = view_name
+        self.path = ""
+        self.start = time.time()
+        self.phases = {}
+        self.events = []
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            end = time.time()
+            self.add_phase(name, start, end)
+
+    def add_phase(self, name, start, end):
+        """
+        a phase timed elsewhere (an async view's logic, run before
+        the page started) - the page is counted from its start
+        """
+        self.phases[name] = self.phases.get(name, 0) + end - start
+        self.start = min(self.start, start)
+        if self.profiler.trace:
+            self.events.append((name, start, end))
+
+    def finish(self):
+        self.profiler.add_page(self, time.time())
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    index = int(round((p / 100.0) * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class BakeProfiler(object):
+
+    filename = "bake_profile.json"
+    trace_filename = "bake_trace.json"
+    slowest_count = 20
+
+    def __init__(self, bake_location, trace=False, worker=0):
+        self.bake_location = bake_location
+        self.trace = trace
+        if worker:
+            # a --worker bake reports on its own share
+            suffix = ".worker-{0}.json".format(worker)
+            self.filename = self.filename.replace(".json", suffix)
+            self.trace_filename = self.trace_filename.replace(".json", suffix)
+        self.views = {}
+        self.events = []
+        self._lock = threading.Lock()
+
+    def start_page(self, view_name):
+        return PageTimer(self, view_name)
+
+    def _view(self, view_name):
+        if view_name not in self.views:
+            self.views[view_name] = {"durations": [],
+                                     "phases": {},
+                                     "slowest": [],
+                                     "start": None,
+                                     "end": None}
+        return self.views[view_name]
+
+    def add_page(self, timer, end):
+        duration = end - timer.start
+        with self._lock:
+            v = self._view(timer.view_name)
+            v["durations"].append(duration)
+            for k, t in timer.phases.items():
+                v["phases"][k] = v["phases"].get(k, 0) + t
+            entry = (duration, timer.path)
+            if len(v["slowest"]) < self.slowest_count:
+                heapq.heappush(v["slowest"], entry)
+            else:
+                heapq.heappushpop(v["slowest"], entry)
+            if v["start"] is None or timer.start < v["start"]:
+                v["start"] = timer.start
+            if v["end"] is None or end > v["end"]:
+                v["end"] = end
+            if self.trace:
+                pid = os.getpid()
+                tid = threading.get_ident()
+                args = {"path": timer.path, "view": timer.view_name}
+                self.events.append(self._event(timer.view_name, timer.start,
+                                               end, pid, tid, args))
+                for name, start, stop in timer.events:
+                    self.events.append(self._event(name, start, stop,
+                                                   pid, tid, args))
+
+    def _event(self, name, start, end, pid, tid, args):
+        return {"name": name,
+                "ph": "X",
+                "ts": int(start * 1000000),
+                "dur": int((end - start) * 1000000),
+                "pid": pid,
+                "tid": tid,
+                "args": args}
+
+    def pop_updates(self):
+        """
+        timings since last called - passed from pool workers to the parent
+        """
+        with self._lock:
+            updates = {"views": self.views, "events": self.events}
+            self.views = {}
+            self.events = []
+        return updates
+
+    def merge(self, updates):
+        with self._lock:
+            for name, other in updates["views"].items():
+                v = self._view(name)
+                v["durations"].extend(other["durations"])
+                for k, t in other["phases"].items():
+                    v["phases"][k] = v["phases"].get(k, 0) + t
+                v["slowest"] = heapq.nlargest(self.slowest_count,
+                                              v["slowest"] + other["slowest"])
+                heapq.heapify(v["slowest"])
+                starts = [x for x in [v["start"], other["start"]] if x]
+                ends = [x for x in [v["end"], other["end"]] if x]
+                v["start"] = min(starts) if starts else None
+                v["end"] = max(ends) if ends else None
+            self.events.extend(updates["events"])
+
+    def report(self):
+        report = {"generated": datetime.now().isoformat(), "views": {}}
+        for name, v in self.views.items():
+            durations = sorted(v["durations"])
+            wall = (v["end"] or 0) - (v["start"] or 0)
+            pages_per_second = None
+            if wall > 0:
+                pages_per_second = round(len(durations) / wall, 2)
+            report["views"][name] = {
+                "pages": len(durations),
+                "wall_time": round(wall, 3),
+                "pages_per_second": pages_per_second,
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "p99": percentile(durations, 99),
+                "phases": {k: round(v["phases"].get(k, 0), 3)
+                           for k in phases},
+                "slowest": [[round(d, 4), p] for d, p in
+                            sorted(v["slowest"], reverse=True)],
+            }
+        return report
+
+    def save(self):
+        report = self.report()
+        with open(Path(self.bake_location, self.filename), "w") as f:
+            json.dump(report, f, indent=1)
+        template = "{name}: {pages} pages, {pages_per_second}/sec, p95 {p95}"
+        for name, v in report["views"].items():
+            p95 = v["p95"]
+            print(template.format(name=name,
+                                  pages=v["pages"],
+                                  pages_per_second=v["pages_per_second"],
+                                  p95=round(p95, 4) if p95 else p95))
+        print("profile written to {0}".format(self.filename))
+        if self.trace:
+            with open(Path(self.bake_location, self.trace_filename), "w") as f:
+                json.dump({"traceEvents": self.events}, f)
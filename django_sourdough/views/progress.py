@@ -0,0 +1,232 @@
+'''
+
+BakeProgress - progress reports for long bakes.
+
+Every --progress_interval seconds (default 5) a progress line is
+printed (verbose_level 1 and up) and, with --progress PATH, a json
+line is written to PATH - a file to append to, or a named pipe (FIFO)
+for a dashboard to read from:
+
+{"event": "progress", "time": ..., "worker": ..., "view": ...,
+ "view_done": ..., "view_total": ..., "done": ..., "total": ...,
+ "rendered": ..., "pages_per_sec": ..., "eta_seconds": ...,
+ "view_eta_seconds": ..., "errors": ..., "retrying": ...}
+
+"start", "view" (a view has been queued or baked) and "done" events
+are written too. total (and eta) is null while the number of pages is
+unknown - until every view has been queued. pages_per_sec is the rate
+over the last minute. errors counts pages that have failed for good.
+
+Writing to a pipe never holds up the bake - events are dropped while
+no reader has it open or it is full.
+
+'''
+
+import errno
+import json
+import os
+import socket
+import stat
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+
+def _round(value, digits):
+    if value is None:
+        return None
+    return round(value, digits)
+
+
+class BakeProgress(object):
+
+    # seconds of history used for the pages per second rate
+    window = 60.0
+
+    def __init__(self, path=None, interval=5.0, verbose_level=1,
+                 worker=None, error_log=None, retry_queue=None):
+        self.path = path
+        self.interval = interval
+        self.verbose_level = verbose_level
+        if not worker:
+            worker = "{0}-{1}".format(socket.gethostname(), os.getpid())
+        self.worker = worker
+        self.error_log = error_log
+        self.retry_queue = retry_queue
+        self.views = {}
+        self.started = time.time()
+        self.samples = deque([(self.started, 0)])
+        self.last_report = self.started
+        self._fd = None
+        self._lock = threading.Lock()
+        self.emit("start")
+
+    @classmethod
+    def from_options(cls, **kwargs):
+        worker = kwargs.get("worker_name")
+        if not worker and kwargs.get("worker"):
+            worker = "worker {0} of {1}".format(kwargs["worker"],
+                                                kwargs["worker_count"])
+        return cls(kwargs.get("progress_path"),
+                   kwargs.get("progress_interval", 5.0),
+                   kwargs.get("verbose_level", 1),
+                   worker,
+                   kwargs.get("error_log"),
+                   kwargs.get("retry_queue"))
+
+    def _view(self, view_name):
+        if view_name not in self.views:
+            self.views[view_name] = {"done": 0, "rendered": 0, "total": None}
+        return self.views[view_name]
+
+    def expect(self, view_names):
+        """
+        views that will be baked - the bake's total is unknown
+        until all of them have one
+        """
+        with self._lock:
+            for view_name in view_names:
+                self._view(view_name)
+
+    def set_total(self, view_name, total):
+        """
+        total is the expected number of pages - None if not known
+        """
+        with self._lock:
+            self._view(view_name)["total"] = total
+        self.emit("view", view=view_name, view_total=total)
+
+    def add(self, view_name, count, rendered=0):
+        """
+        count pages of this view processed, rendered of them written
+        (count is 0 for retries - already counted)
+        """
+        now = time.time()
+        with self._lock:
+            view = self._view(view_name)
+            view["done"] += count
+            view["rendered"] += rendered
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+        self.report(view_name, now)
+
+    def finish_view(self, view_name):
+        view = self._view(view_name)
+        self.emit("view", view=view_name, view_done=view["done"],
+                  view_total=view["total"], rendered=view["rendered"],
+                  finished=True)
+
+    def totals(self):
+        done = sum(v["done"] for v in self.views.values())
+        rendered = sum(v["rendered"] for v in self.views.values())
+        total = None
+        if all(v["total"] is not None for v in self.views.values()):
+            total = sum(v["total"] for v in self.views.values())
+        return done, rendered, total
+
+    def rate(self, done, now):
+        """
+        pages per second over the last window
+        """
+        self.samples.append((now, done))
+        while len(self.samples) > 2 and now - self.samples[1][0] > self.window:
+            self.samples.popleft()
+        first_time, first_done = self.samples[0]
+        if now - first_time <= 0:
+            return None
+        return (done - first_done) / (now - first_time)
+
+    def report(self, view_name, now=None):
+        if now is None:
+            now = time.time()
+        with self._lock:
+            view = dict(self._view(view_name))
+            done, rendered, total = self.totals()
+            rate = self.rate(done, now)
+        eta = None
+        view_eta = None
+        if rate:
+            if total is not None:
+                eta = max(total - done, 0) / rate
+            if view["total"] is not None:
+                view_eta = max(view["total"] - view["done"], 0) / rate
+        if self.verbose_level > 0:
+            line = "{0}: {1}".format(view_name, view["done"])
+            if view["total"]:
+                p = round((view["done"] / float(view["total"])) * 100, 2)
+                line += " out of {0} ({1}%)".format(view["total"], p)
+            if rate is not None:
+                line += " - {0:.1f} pages/sec".format(rate)
+            remaining = eta if eta is not None else view_eta
+            if remaining is not None:
+                line += ", eta {0}".format(timedelta(seconds=round(remaining)))
+            print(line)
+        self.emit("progress",
+                  view=view_name,
+                  view_done=view["done"],
+                  view_total=view["total"],
+                  done=done,
+                  total=total,
+                  rendered=rendered,
+                  pages_per_sec=_round(rate, 3),
+                  eta_seconds=_round(eta, 1),
+                  view_eta_seconds=_round(view_eta, 1))
+
+    def emit(self, event, **fields):
+        if not self.path:
+            return
+        record = {"event": event,
+                  "time": datetime.now().isoformat(),
+                  "worker": self.worker}
+        record.update(fields)
+        if self.error_log is not None:
+            record["errors"] = sum(self.error_log.failures.values())
+        if self.retry_queue is not None:
+            record["retrying"] = len(self.retry_queue)
+        self._write(json.dumps(record) + "\n")
+
+    def _open(self):
+        if self._fd is not None:
+            return self._fd
+        try:
+            fifo = stat.S_ISFIFO(os.stat(self.path).st_mode)
+        except OSError:
+            fifo = False
+        try:
+            if fifo:
+                # fails until a reader has opened the pipe
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            else:
+                self._fd = os.open(self.path,
+                                   os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                                   0o644)
+        except OSError as e:
+            if e.errno != errno.ENXIO:
+                raise
+        return self._fd
+
+    def _write(self, line):
+        with self._lock:
+            fd = self._open()
+            if fd is None:
+                return
+            try:
+                os.write(fd, line.encode("utf-8"))
+            except BlockingIOError:
+                # reader is behind - drop this event
+                pass
+            except BrokenPipeError:
+                # reader has gone - reopen for the next one
+                os.close(fd)
+                self._fd = None
+
+    def close(self):
+        done, rendered, total = self.totals()
+        self.emit("done", done=done, total=total, rendered=rendered,
+                  seconds=round(time.time() - self.started, 1))
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
@@ -0,0 +1,251 @@
+'''
+
+Per page SQL query accounting while baking - to catch N+1 queries
+in view logic (works with DEBUG off).
+
+Every query run while a page renders is counted and timed through
+django's execute_wrapper hook. Queries are grouped by shape (the SQL
+with placeholders, IN lists collapsed) to find the most repeated one.
+
+BakeQueryLog aggregates per view and writes bake_queries.json to the
+bake directory. A view is flagged if:
+
+- a single page repeats the same query shape many times, or
+- pages with more content run more queries (query count correlates
+  with page size) - the usual sign of a query inside a loop.
+
+Pages of an async view are fetched concurrently, so their queries
+interleave on the same connection. route_queries() passes each query
+to the recorders of the page that ran it (set with page_recorders()
+and carried through sync_to_async by a context variable).
+
+'''
+
+import contextvars
+import functools
+import heapq
+import json
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.db import connections
+
+in_list = re.compile(r"\((?:\s*%s\s*,)+\s*%s\s*\)")
+
+
+def query_shape(sql):
+    return in_list.sub("(%s, ...)", sql)
+
+
+class QueryCounter(object):
+    """
+    execute_wrapper that counts and times queries
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.time()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.time() - start
+            self.count += 1
+            self.shapes[query_shape(sql)] += 1
+
+    def merge(self, other):
+        self.count += other.count
+        self.time += other.time
+        self.shapes.update(other.shapes)
+
+
+@contextmanager
+def count_queries(active=True):
+    """
+    yields a QueryCounter for all connections inside the block
+    """
+    counter = QueryCounter()
+    if active is False:
+        yield counter
+        return
+    with ExitStack() as stack:
+        for c in connections.all():
+            stack.enter_context(c.execute_wrapper(counter))
+        yield counter
+
+
+# execute_wrappers of the page running queries in this context
+_page_recorders = contextvars.ContextVar("page_recorders", default=())
+
+
+def _route_query(execute, sql, params, many, context):
+    for recorder in _page_recorders.get():
+        execute = functools.partial(recorder, execute)
+    return execute(sql, params, many, context)
+
+
+@contextmanager
+def route_queries(active=True):
+    """
+    inside the block, queries on all connections go to the
+    recorders set by page_recorders()
+    """
+    if active is False:
+        yield
+        return
+    with ExitStack() as stack:
+        for c in connections.all():
+            stack.enter_context(c.execute_wrapper(_route_query))
+        yield
+
+
+@contextmanager
+def page_recorders(*recorders):
+    """
+    send queries run in this context (and its sync_to_async calls)
+    to these execute_wrappers - None is ignored
+    """
+    token = _page_recorders.set(tuple(r for r in recorders if r))
+    try:
+        yield
+    finally:
+        _page_recorders.reset(token)
+
+
+def correlation(xs, ys):
+    n = len(xs)
+    if n < 2:
+        return None
+    mean_x = sum(xs) / float(n)
+    mean_y = sum(ys) / float(n)
+    cov = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    var_y = sum((y - mean_y) ** 2 for y in ys)
+    if var_x == 0 or var_y == 0:
+        return None
+    return cov / (var_x * var_y) ** 0.5
+
+
+class BakeQueryLog(object):
+
+    filename = "bake_queries.json"
+    worst_count = 10
+    # flag a page that repeats one query shape this many times
+    repeat_threshold = 10
+    # flag a view if query count and page size correlate this strongly
+    correlation_threshold = 0.8
+    min_pages = 10
+
+    def __init__(self, bake_location, worker=0):
+        self.bake_location = bake_location
+        if worker:
+            # a --worker bake reports on its own share
+            self.filename = self.filename.replace(
+                ".json", ".worker-{0}.json".format(worker))
+        self.views = {}
+        self._lock = threading.Lock()
+
+    def _view(self, view_name):
+        if view_name not in self.views:
+            self.views[view_name] = {"counts": [],
+                                     "sizes": [],
+                                     "time": 0.0,
+                                     "shapes": Counter(),
+                                     "worst": [],
+                                     # (repeats, path, sql) - the page
+                                     # repeating one query the most
+                                     "repeated": (0, "", "")}
+        return self.views[view_name]
+
+    def add_page(self, view_name, path, counter, size):
+        shape, repeats = "", 0
+        if counter.shapes:
+            shape, repeats = counter.shapes.most_common(1)[0]
+        with self._lock:
+            v = self._view(view_name)
+            v["counts"].append(counter.count)
+            v["sizes"].append(size)
+            v["time"] += counter.time
+            v["shapes"].update(counter.shapes)
+            entry = (counter.count, round(counter.time, 4), path,
+                     repeats, shape)
+            if len(v["worst"]) < self.worst_count:
+                heapq.heappush(v["worst"], entry)
+            else:
+                heapq.heappushpop(v["worst"], entry)
+            if repeats > v["repeated"][0]:
+                v["repeated"] = (repeats, path, shape)
+
+    def pop_updates(self):
+        with self._lock:
+            updates = self.views
+            self.views = {}
+        return updates
+
+    def merge(self, updates):
+        with self._lock:
+            for name, other in updates.items():
+                v = self._view(name)
+                v["counts"].extend(other["counts"])
+                v["sizes"].extend(other["sizes"])
+                v["time"] += other["time"]
+                v["shapes"].update(other["shapes"])
+                v["worst"] = heapq.nlargest(self.worst_count,
+                                            v["worst"] + other["worst"])
+                heapq.heapify(v["worst"])
+                v["repeated"] = max(v["repeated"], other["repeated"])
+
+    def warnings(self, name, v):
+        warnings = []
+        repeats, path, shape = v["repeated"]
+        if repeats >= self.repeat_threshold:
+            message = "{0}: a page repeats one query {1} times ({2}) - {3}"
+            warnings.append(message.format(name, repeats, path, shape))
+        if len(v["counts"]) >= self.min_pages:
+            r = correlation(v["counts"], v["sizes"])
+            if r is not None and r >= self.correlation_threshold:
+                message = "{0}: query count grows with page size (r={1:.2f}) - possible N+1"
+                warnings.append(message.format(name, r))
+        return warnings
+
+    def report(self):
+        report = {"views": {}, "warnings": []}
+        for name, v in self.views.items():
+            pages = len(v["counts"])
+            shape, repeats = "", 0
+            if v["shapes"]:
+                shape, repeats = v["shapes"].most_common(1)[0]
+            report["views"][name] = {
+                "pages": pages,
+                "queries": sum(v["counts"]),
+                "queries_per_page": round(sum(v["counts"]) / float(pages), 2) if pages else 0,
+                "max_queries": max(v["counts"]) if pages else 0,
+                "sql_time": round(v["time"], 3),
+                "most_repeated": {"sql": shape, "count": repeats},
+                "most_repeated_on_a_page": {"sql": v["repeated"][2],
+                                            "count": v["repeated"][0],
+                                            "path": v["repeated"][1]},
+                "worst_pages": [{"queries": c, "sql_time": t, "path": p,
+                                 "repeats": r, "repeated_sql": s}
+                                for c, t, p, r, s in sorted(v["worst"], reverse=True)],
+            }
+            report["warnings"].extend(self.warnings(name, v))
+        return report
+
+    def save(self):
+        report = self.report()
+        with open(Path(self.bake_location, self.filename), "w") as f:
+            json.dump(report, f, indent=1)
+        template = "{name}: {queries_per_page} queries/page (max {max_queries}), {sql_time}s sql"
+        for name, v in report["views"].items():
+            print(template.format(name=name, **v))
+        for w in report["warnings"]:
+            print("warning: " + w)
+        print("query report written to {0}".format(self.filename))
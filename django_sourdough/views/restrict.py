@@ -0,0 +1,181 @@
+'''
+
+LimitQuery - the --restrict_n bake options parsed into a filter
+for the positional arguments returned by bake_args.
+
+Each --restrict_n value is a comma separated list of terms:
+
+E14000530,E14000531 - exact values
+100..200 - an inclusive range (numeric if both ends are numbers)
+E1400* - a prefix
+
+A bake_args(self, limit_query) method is passed the LimitQuery
+(or None if nothing is restricted) and can apply it in its query:
+
+def bake_args(self, limit_query=None):
+    query = Constituency.objects.all()
+    if limit_query:
+        query = limit_query.filter(query, "gss_code")
+    for c in query.iterator():
+        yield (c.gss_code,)
+
+Arguments are also checked against it after bake_args, so views
+that ignore it are still restricted correctly. A numeric range on a
+text field can't be compared in the database ("99" sorts after "150"),
+so filter() leaves that restriction to the check after bake_args.
+
+'''
+
+import operator
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.db.models import Q
+
+numeric_fields = (models.AutoField, models.IntegerField, models.FloatField,
+                  models.DecimalField)
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_numeric_field(queryset, field):
+    """
+    True if field is a number field of the queryset's model,
+    None if it can't be told (e.g. a lookup across a relation)
+    """
+    try:
+        f = queryset.model._meta.get_field(field)
+    except FieldDoesNotExist:
+        return None
+    return isinstance(f, numeric_fields)
+
+
+class ArgRestriction(object):
+    """
+    allowed values for one positional argument
+    """
+
+    def __init__(self, values=None, ranges=None, prefixes=None):
+        self.values = set(values or [])
+        self.ranges = list(ranges or [])
+        self.prefixes = tuple(prefixes or [])
+
+    @classmethod
+    def parse(cls, text):
+        values = []
+        ranges = []
+        prefixes = []
+        for term in text.split(","):
+            term = term.strip()
+            if not term:
+                continue
+            if ".." in term:
+                low, high = term.split("..", 1)
+                ranges.append((low, high))
+            elif term.endswith("*"):
+                prefixes.append(term[:-1])
+            else:
+                values.append(term)
+        return cls(values, ranges, prefixes)
+
+    def _in_range(self, value, low, high):
+        n_low, n_high, n = _number(low), _number(high), _number(value)
+        if None not in (n_low, n_high, n):
+            return n_low <= n <= n_high
+        return low <= value <= high
+
+    def matches(self, value):
+        """
+        model instances are compared by their pk
+        """
+        if hasattr(value, "pk"):
+            value = value.pk
+        value = str(value)
+        if value in self.values:
+            return True
+        if self.prefixes and value.startswith(self.prefixes):
+            return True
+        for low, high in self.ranges:
+            if self._in_range(value, low, high):
+                return True
+        return False
+
+    def q(self, field, numeric=None):
+        """
+        Q object to apply this restriction to a model field
+        range ends are passed as they are, for the field to convert -
+        numeric is False for a text field, where a numeric range
+        can't be applied (matches everything)
+        """
+        parts = []
+        if self.values:
+            parts.append(Q(**{field + "__in": self.values}))
+        for p in self.prefixes:
+            parts.append(Q(**{field + "__startswith": p}))
+        for low, high in self.ranges:
+            if numeric is False and None not in (_number(low),
+                                                 _number(high)):
+                return Q()
+            parts.append(Q(**{field + "__gte": low, field + "__lte": high}))
+        if not parts:
+            return Q()
+        return reduce(operator.or_, parts)
+
+
+class LimitQuery(object):
+    """
+    restrictions for bake_args, keyed by argument position (from 0)
+    """
+
+    def __init__(self, restrictions=None):
+        self.restrictions = restrictions or {}
+
+    @classmethod
+    def from_options(cls, **kwargs):
+        """
+        build from the --restrict_1 to --restrict_10 options
+        returns None if there are no restrictions
+        """
+        restrictions = {}
+        for n in range(1, 11):
+            restrict = kwargs.get("restrict_{0}".format(n))
+            if restrict:
+                restrictions[n - 1] = ArgRestriction.parse(restrict)
+        if restrictions:
+            return cls(restrictions)
+        return None
+
+    def __bool__(self):
+        return bool(self.restrictions)
+
+    def get(self, position):
+        return self.restrictions.get(position)
+
+    def matches(self, args):
+        """
+        does this set of bake arguments pass the restrictions
+        """
+        if not args:
+            return True
+        for position, r in self.restrictions.items():
+            if position < len(args) and r.matches(args[position]) is False:
+                return False
+        return True
+
+    def filter(self, queryset, *fields):
+        """
+        filter a queryset - fields are the model fields that
+        become each positional argument (None to skip one)
+        """
+        for position, field in enumerate(fields):
+            r = self.get(position)
+            if r and field:
+                numeric = _is_numeric_field(queryset, field)
+                queryset = queryset.filter(r.q(field, numeric))
+        return queryset
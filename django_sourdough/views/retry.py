@@ -0,0 +1,208 @@
+'''
+
+Deferred retries and the structured error log.
+
+A page that errors in any phase (context, render, minify, write) is
+not retried on the spot - it is put on a RetryQueue with a time it
+can be retried after, and baking carries on with the next page. Once
+the main pass has finished the queue is worked through, waiting only
+if nothing is ready yet. The wait doubles after each failed attempt:
+
+--retry_backoff [5] - seconds before the first retry
+--retry_backoff_max [300] - longest wait between attempts
+--retry_errors [3] - attempts in total before a page has failed
+
+Every error is recorded as a line of json in bake_errors.jsonl
+(time, view, path, args, phase, attempt, whether it will be retried,
+the error and traceback).
+
+With --jobs, workers pass their queued retries and error records back
+to the parent, which writes the log and sends retries back out to
+the pool.
+
+'''
+
+import json
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+
+class RetryItem(object):
+
+    def __init__(self, view_name, args, attempt, ready):
+        self.view_name = view_name
+        self.args = args
+        self.attempt = attempt
+        self.ready = ready
+
+
+class RetryQueue(object):
+
+    # items ready within this many seconds of each other are retried together
+    batch_window = 1.0
+
+    def __init__(self, retry_errors=3, backoff=5.0, backoff_max=300.0):
+        self.retry_errors = retry_errors
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.items = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_options(cls, **kwargs):
+        return cls(kwargs.get("retry_errors", 3),
+                   kwargs.get("retry_backoff", 5.0),
+                   kwargs.get("retry_backoff_max", 300.0))
+
+    def __len__(self):
+        return len(self.items)
+
+    def delay(self, attempt):
+        """
+        seconds to wait before this attempt (the 2nd is the first retry)
+        """
+        return min(self.backoff * (2 ** max(attempt - 2, 0)), self.backoff_max)
+
+    def is_final(self, attempt):
+        return attempt >= self.retry_errors
+
+    def add(self, view_name, args, attempt):
+        """
+        queue args to be tried again - returns the delay
+        """
+        delay = self.delay(attempt)
+        with self._lock:
+            self.items.append(RetryItem(view_name, args, attempt,
+                                        time.time() + delay))
+        return delay
+
+    def wait(self):
+        """
+        wait until an item is ready, then return all ready items
+        grouped by (view_name, attempt)
+        """
+        if not self.items:
+            return OrderedDict()
+        wait = min(x.ready for x in self.items) - time.time()
+        if wait > 0:
+            if wait >= self.batch_window:
+                print("waiting {0:.1f}s for retries".format(wait))
+            time.sleep(wait)
+        now = time.time() + self.batch_window
+        groups = OrderedDict()
+        with self._lock:
+            ready = [x for x in self.items if x.ready <= now]
+            self.items = [x for x in self.items if x.ready > now]
+        for x in ready:
+            groups.setdefault((x.view_name, x.attempt), []).append(x.args)
+        return groups
+
+    def pop_updates(self):
+        with self._lock:
+            updates = [(x.view_name, x.args, x.attempt, x.ready)
+                       for x in self.items]
+            self.items = []
+        return updates
+
+    def merge(self, updates):
+        with self._lock:
+            self.items.extend(RetryItem(*x) for x in updates)
+
+
+class BakeErrorLog(object):
+    """
+    json lines log of every error while baking
+    records made in pool workers are passed back to be written by
+    the parent process
+    """
+
+    filename = "bake_errors.jsonl"
+
+    def __init__(self, bake_location):
+        self.bake_location = bake_location
+        self.failures = {}
+        self._pid = os.getpid()
+        self._pending = []
+        self._file = None
+        self._lock = threading.Lock()
+
+    def add(self, view_name, path, error, args=None, phase="",
+            attempt=1, retry=False):
+        tb = traceback.format_exception(type(error), error,
+                                        error.__traceback__)
+        record = {"time": datetime.now().isoformat(),
+                  "view": view_name,
+                  "path": path,
+                  "args": [str(x) for x in args] if args else [],
+                  "phase": phase,
+                  "attempt": attempt,
+                  "retry": retry,
+                  "error_type": type(error).__name__,
+                  "error": str(error),
+                  "traceback": "".join(tb)}
+        self.merge([record])
+
+    def _write(self, records):
+        if self._file is None:
+            self._file = open(Path(self.bake_location, self.filename), "a")
+        for r in records:
+            self._file.write(json.dumps(r) + "\n")
+        self._file.flush()
+
+    def pop_updates(self):
+        with self._lock:
+            updates = self._pending
+            self._pending = []
+        return updates
+
+    def merge(self, records):
+        with self._lock:
+            for r in records:
+                if r["retry"] is False:
+                    self.failures[r["view"]] = self.failures.get(r["view"], 0) + 1
+            if os.getpid() == self._pid:
+                self._write(records)
+            else:
+                self._pending.extend(records)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+def bake_retries(views, **kwargs):
+    """
+    work through the retry queue for these views
+    """
+    queue = kwargs["retry_queue"]
+    writer = kwargs.get("writer")
+    by_name = {v.url_name: v for v in views}
+    instances = {}
+
+    def remaining():
+        # queued writes that failed are added to the queue
+        if writer is not None:
+            writer.flush()
+        return len(queue)
+
+    while remaining():
+        for (view_name, attempt), options in queue.wait().items():
+            v = by_name[view_name]
+            if view_name not in instances:
+                instances[view_name] = v()
+            i = instances[view_name]
+            print("retrying {0} {1} (attempt {2})".format(len(options),
+                                                          view_name,
+                                                          attempt))
+            if v.bake_batch_size:
+                v._prepare_batch(options)
+            rendered = i._render_batch(options, attempt=attempt, **kwargs)
+            if kwargs.get("progress") is not None:
+                # already counted as processed
+                kwargs["progress"].add(view_name, 0, rendered)
@@ -0,0 +1,244 @@
+'''
+
+StaticSync - copies static files into the bake location, only
+copying what has changed since the last sync.
+
+The size, modified time and content hash of every file synced is kept
+in bake_static_manifest.json in the bake directory. On the next sync a
+source file is copied again only if:
+
+- its size or modified time differ from the manifest and its content
+  hash has changed (a collectstatic that rewrites files with the same
+  content does not cause a copy)
+- or it is missing from the destination
+
+Source and destination are each listed once (os.scandir, a directory
+per thread) and files are copied by a pool of threads.
+
+--static_mode:
+
+copy - (default) copy files, keeping their modified times
+hardlink - link destination files to the source files (same
+filesystem only - falls back to copying)
+reflink - copy-on-write clone (btrfs, xfs, APFS - falls back to
+copying)
+
+--static_delete removes destination files that were synced before but
+are no longer in the source, along with their .gz and .br siblings.
+Files in the destination that were not put there by a sync are never
+removed.
+
+'''
+
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .compress import encodings as compressed_encodings
+from .manifest import content_hasher
+from .output_index import OutputIndex, scan_tree
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+static_modes = ["copy", "hardlink", "reflink"]
+
+# ioctl to clone a file on linux
+FICLONE = 0x40049409
+
+
+def file_hash(path, chunk_size=1 << 16):
+    hasher = content_hasher()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _size_and_mtime(entry):
+    st = entry.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def _list_files(directory, threads):
+    """
+    relative path -> (size, mtime_ns) for every file under directory
+    """
+    root = os.path.normpath(directory)
+    found, _ = scan_tree(root, _size_and_mtime, threads)
+    files = {}
+    for path, value in found.items():
+        rel = os.path.relpath(path, root).replace("\\", "/")
+        files[rel] = value
+    return files
+
+
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError("reflink not available")
+    with open(source, "rb") as src, open(destination, "wb") as dest:
+        fcntl.ioctl(dest.fileno(), FICLONE, src.fileno())
+    shutil.copystat(source, destination)
+
+
+class StaticSync(object):
+
+    filename = "bake_static_manifest.json"
+
+    def __init__(self, bake_location, mode="copy", delete=False, threads=8):
+        if mode not in static_modes:
+            raise ValueError("static mode must be one of {0}".format(
+                static_modes))
+        self.bake_location = bake_location
+        self.mode = mode
+        self.delete = delete
+        self.threads = threads
+        self.manifest = {}
+        self._directories = set()
+        self._lock = threading.Lock()
+        self._fallback = False
+        self.load()
+
+    @property
+    def path(self):
+        return Path(self.bake_location, self.filename)
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError):
+            self.manifest = {}
+
+    def save(self):
+        os.makedirs(self.bake_location, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump(self.manifest, f, separators=(",", ":"))
+
+    def _ensure_directory(self, directory):
+        with self._lock:
+            if directory in self._directories:
+                return
+            self._directories.add(directory)
+        os.makedirs(directory, exist_ok=True)
+
+    def _place(self, source, destination):
+        """
+        put source at destination using the sync mode - through a
+        temporary file, so nothing is written through an existing link
+        """
+        self._ensure_directory(os.path.dirname(destination))
+        temp = "{0}.{1}-{2}.part".format(destination, os.getpid(),
+                                         threading.get_ident())
+        try:
+            if self.mode != "copy" and not self._fallback:
+                try:
+                    if self.mode == "hardlink":
+                        os.link(source, temp)
+                    else:
+                        _reflink(source, temp)
+                    os.replace(temp, destination)
+                    return
+                except OSError as e:
+                    if os.path.exists(temp):
+                        os.remove(temp)
+                    with self._lock:
+                        if not self._fallback:
+                            print("can't {0} static files ({1}) - "
+                                  "copying".format(self.mode, e))
+                        self._fallback = True
+            shutil.copy2(source, temp)
+            os.replace(temp, destination)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    def sync(self, source, destination):
+        """
+        sync the source directory into destination
+        returns (copied, unchanged, deleted) counts
+        """
+        source = os.path.normpath(source)
+        destination = os.path.normpath(destination)
+        key = "{0} -> {1}".format(source, destination)
+        previous = self.manifest.get(key, {})
+        current = {}
+        source_files = _list_files(source, self.threads)
+        os.makedirs(destination, exist_ok=True)
+        existing = OutputIndex.scan(destination, threads=self.threads)
+        self._directories.update(existing.directories)
+
+        to_check = []
+        for rel, (size, mtime) in source_files.items():
+            dest_path = os.path.join(destination, rel)
+            old = previous.get(rel)
+            if old and existing.exists(dest_path) and old[0] == size \
+                    and old[1] == mtime:
+                current[rel] = old
+                continue
+            to_check.append((rel, size, mtime, old, dest_path))
+
+        def check(item):
+            """
+            copy if the content has changed - returns (rel, entry, copied)
+            new files are copied without being hashed first
+            """
+            rel, size, mtime, old, dest_path = item
+            src_path = os.path.join(source, rel)
+            if old and existing.exists(dest_path):
+                digest = file_hash(src_path)
+                if old[2] == digest:
+                    return rel, [size, mtime, digest], False
+            else:
+                digest = None
+            self._place(src_path, dest_path)
+            if digest is None:
+                digest = file_hash(src_path)
+            return rel, [size, mtime, digest], True
+
+        copied = 0
+        with ThreadPoolExecutor(self.threads) as pool:
+            for rel, entry, was_copied in pool.map(check, to_check):
+                current[rel] = entry
+                if was_copied:
+                    copied += 1
+
+        deleted = 0
+        if self.delete:
+            for rel in previous:
+                if rel in current:
+                    continue
+                dest_path = os.path.join(destination, rel)
+                if existing.exists(dest_path):
+                    os.remove(dest_path)
+                    deleted += 1
+                # precompressed versions of the removed file
+                for e in compressed_encodings:
+                    sibling = dest_path + "." + e
+                    if existing.exists(sibling):
+                        os.remove(sibling)
+
+        self.manifest[key] = current
+        unchanged = len(current) - copied
+        return copied, unchanged, deleted
+
+
+def sync_static(directories, destination, bake_location, mode="copy",
+                delete=False, threads=8):
+    """
+    sync each of the static directories into destination,
+    printing what changed
+    """
+    syncer = StaticSync(bake_location, mode, delete, threads)
+    for d in directories:
+        print("syncing {0}".format(d))
+        copied, unchanged, deleted = syncer.sync(d, destination)
+        print("{0} copied, {1} unchanged, {2} deleted".format(
+            copied, unchanged, deleted))
+    syncer.save()
@@ -0,0 +1,209 @@
+'''
+
+BakeTimings - how long each page took to render in earlier bakes,
+used to schedule the next one.
+
+Every bake records the seconds each rendered page took (context,
+render and minify - writes are left out as they may happen on writer
+threads) against its view and bake_args. Saved as bake_timings.json
+in the bake directory. A page baked again is averaged with its
+previous time, so one slow run does not set its place for good.
+
+With --cost_order the history is used to plan the bake:
+
+- each view's bake_args are read in full and baked slowest first
+- --worker splits the pages into balanced shares by expected time
+  (greedy, longest first) rather than taking every nth page. Every
+  worker must see the same bake_timings.json and bake_args to agree
+  on the split - so a --worker bake saves its times to its own
+  bake_timings.worker-N.json, and these are merged into the history
+  by the next bake that is not split by --worker
+- --jobs and --coordinate queue the chunks expected to take longest
+  first, so no long chunk is left to the end of the bake
+
+Pages with no history are expected to take as long as the average
+page of their view (or of the whole bake for a new view).
+
+'''
+
+import heapq
+import json
+import os
+import threading
+from pathlib import Path
+
+from .journal import item_key
+
+
+class BakeTimings(object):
+    """
+    view name -> {item key -> seconds}
+    """
+
+    filename = "bake_timings.json"
+    # weight of the newest time against the history
+    smoothing = 0.5
+
+    def __init__(self, bake_location, worker=0):
+        self.bake_location = bake_location
+        self.worker = worker
+        self.previous = {}
+        self.current = {}
+        self._pending = {}
+        self._means = {}
+        self._overall = None
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def path(self):
+        return Path(self.bake_location, self.filename)
+
+    def worker_path(self, worker):
+        name = self.filename.replace(".json", ".worker-{0}.json".format(worker))
+        return Path(self.bake_location, name)
+
+    def _read(self, path=None):
+        try:
+            with open(path or self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def load(self):
+        self.previous = self._read()
+        self._means = {}
+        self._overall = None
+
+    def has_history(self, view_name=None):
+        if view_name is None:
+            return bool(self.previous)
+        return bool(self.previous.get(view_name))
+
+    def add(self, view_name, args, seconds):
+        key = item_key(args)
+        with self._lock:
+            self.current.setdefault(view_name, {})[key] = seconds
+            self._pending.setdefault(view_name, {})[key] = seconds
+
+    def pop_updates(self):
+        with self._lock:
+            updates = self._pending
+            self._pending = {}
+        return updates
+
+    def merge(self, updates):
+        with self._lock:
+            for view_name, times in updates.items():
+                self.current.setdefault(view_name, {}).update(times)
+
+    def known(self, view_name, args):
+        return item_key(args) in self.previous.get(view_name, {})
+
+    def view_mean(self, view_name):
+        if view_name not in self._means:
+            times = self.previous.get(view_name)
+            mean = None
+            if times:
+                mean = sum(times.values()) / len(times)
+            self._means[view_name] = mean
+        return self._means[view_name]
+
+    def overall_mean(self):
+        if self._overall is None:
+            total = 0.0
+            count = 0
+            for times in self.previous.values():
+                total += sum(times.values())
+                count += len(times)
+            self._overall = total / count if count else 0.0
+        return self._overall
+
+    def estimate(self, view_name, args):
+        """
+        expected seconds to render this page
+        """
+        times = self.previous.get(view_name, {})
+        seconds = times.get(item_key(args))
+        if seconds is None:
+            seconds = self.view_mean(view_name)
+        if seconds is None:
+            seconds = self.overall_mean()
+        return seconds
+
+    def cost_order(self, view_name, options):
+        """
+        list of options, slowest first
+        """
+        costs = [(self.estimate(view_name, o), o) for o in options]
+        costs.sort(key=lambda x: x[0], reverse=True)
+        return [o for cost, o in costs]
+
+    def balanced_share(self, view_name, options, worker, worker_count):
+        """
+        this worker's share of options (in cost order) - each page goes
+        to the worker with the least expected time so far
+        worker is 1 to worker_count
+        """
+        loads = [(0.0, n) for n in range(worker_count)]
+        share = []
+        for o in options:
+            load, n = heapq.heappop(loads)
+            if n == worker - 1:
+                share.append(o)
+            heapq.heappush(loads, (load + self.estimate(view_name, o), n))
+        return share
+
+    def order_chunks(self, views, source):
+        """
+        (view index, chunk) pairs from source, longest chunk first
+        """
+        costed = []
+        for view_index, chunk in source:
+            name = views[view_index].url_name
+            cost = sum(self.estimate(name, o) for o in chunk)
+            costed.append((cost, view_index, chunk))
+        costed.sort(key=lambda x: x[0], reverse=True)
+        for cost, view_index, chunk in costed:
+            yield view_index, chunk
+
+    def _blend(self, history, new):
+        w = self.smoothing
+        for view_name, times in new.items():
+            saved = history.setdefault(view_name, {})
+            for key, seconds in times.items():
+                old = saved.get(key)
+                if old is not None:
+                    seconds = w * seconds + (1 - w) * old
+                saved[key] = round(seconds, 6)
+
+    def _write(self, path, data):
+        temp = Path("{0}.{1}.tmp".format(path, os.getpid()))
+        with open(temp, "w") as f:
+            json.dump(data, f)
+        os.replace(temp, path)
+
+    def save(self):
+        """
+        blend this bake's times into the history on disk - read again
+        first, in case other workers have saved since this bake began
+
+        a --worker bake adds to its own file instead, leaving the
+        history the other workers plan from as it is
+        """
+        if self.worker:
+            path = self.worker_path(self.worker)
+            times = self._read(path)
+            for view_name, new in self.current.items():
+                times.setdefault(view_name, {}).update(new)
+            self._write(path, times)
+            return
+        history = self._read()
+        worker_files = list(Path(self.bake_location).glob(
+            self.filename.replace(".json", ".worker-*.json")))
+        for path in worker_files:
+            self._blend(history, self._read(path))
+        self._blend(history, self.current)
+        self._write(self.path, history)
+        for path in worker_files:
+            path.unlink()
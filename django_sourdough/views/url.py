@@ -22,6 +22,7 @@ Apps then don't need a separate url.py.
 
 import re
 import six
+from datetime import timedelta
 from importlib import import_module
 from types import ModuleType
 
@@ -33,7 +34,10 @@ from django.conf.urls import url
 from django.shortcuts import HttpResponseRedirect
 
 
+from .coordinator import bake_coordinated
 from .functional import FunctionalView, LogicalView
+from .parallel import bake_in_pool, can_fork
+from .retry import bake_retries
 
 
 def make_comparison(v):
@@ -82,18 +86,96 @@ class AppUrl(object):
                     return True
         return False
 
-    def bake(self, **kwargs):
+    def views_to_bake(self, **kwargs):
         """
-        bake all views with a bake_path
+        views with bake_args, reduced by --only_views
         """
-
         restrict_to_views = kwargs.get("only_views",[])
 
+        to_bake = []
         for v in self.views:
             if hasattr(v, "bake_args") and hasattr(v, "url_name"):
                 if len(restrict_to_views) == 0 or v.url_name in restrict_to_views:
                     if v.url_name:
-                        v.bake(**kwargs)
+                        to_bake.append(v)
+        return to_bake
+
+    def plan(self, **kwargs):
+        """
+        print the pages each view would bake (after --restrict_n,
+        --worker, --only_absent, --only_old and --resume) without
+        rendering anything - with an estimate of how long it would
+        take if there are timings from earlier bakes
+        """
+        timings = kwargs.get("timings")
+        jobs = max(kwargs.get("jobs", 1), 1)
+        total_pages = 0
+        total_to_bake = 0
+        total_seconds = None
+        total_unknown = 0
+        for v in self.views_to_bake(**kwargs):
+            pages, to_bake, seconds, unknown = v().plan(**kwargs)
+            line = "{0}: {1} pages, {2} to bake".format(v.url_name, pages,
+                                                          to_bake)
+            if seconds is not None:
+                line += ", estimated {0}".format(_duration(seconds))
+                if unknown:
+                    line += " ({0} pages with no timings)".format(unknown)
+                total_seconds = (total_seconds or 0) + seconds
+            print(line)
+            total_pages += pages
+            total_to_bake += to_bake
+            total_unknown += unknown
+
+        line = "total: {0} pages, {1} to bake".format(total_pages,
+                                                      total_to_bake)
+        if total_seconds is not None:
+            line += ", estimated {0}".format(_duration(total_seconds))
+            if jobs > 1:
+                line += " ({0} with {1} jobs)".format(
+                    _duration(total_seconds / jobs), jobs)
+        print(line)
+        if timings is not None and not timings.has_history():
+            print("no bake_timings.json - estimates are available after "
+                  "the first bake")
+        elif total_unknown:
+            print("pages with no timings are estimated from the average "
+                  "for their view")
+
+    def bake(self, **kwargs):
+        """
+        bake all views with a bake_path
+        if jobs > 1, bake all views in a shared process pool
+        with --coordinate, bake as one worker of a shared queue
+        pages that errored are retried once all views are baked
+        """
+
+        jobs = kwargs.get("jobs", 1)
+        to_bake = self.views_to_bake(**kwargs)
+
+        if kwargs.get("coordinate"):
+            bake_coordinated(to_bake, **kwargs)
+            return
+
+        if jobs > 1 and can_fork() is False:
+            print("process pool not available - baking with one job")
+            jobs = 1
+
+        if jobs > 1:
+            bake_in_pool(to_bake, **kwargs)
+        else:
+            if kwargs.get("progress") is not None:
+                kwargs["progress"].expect(v.url_name for v in to_bake)
+            for v in to_bake:
+                v.bake(**kwargs)
+            if kwargs.get("retry_queue") is not None:
+                bake_retries(to_bake, **kwargs)
+
+
+def _duration(seconds):
+    if seconds < 60:
+        return "{0:.1f}s".format(seconds)
+    return str(timedelta(seconds=round(seconds)))
 
 
 def include_view(arg, namespace=None, app_name=None):
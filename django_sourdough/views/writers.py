@@ -0,0 +1,531 @@
+'''
+
+BakeWriter - writes baked pages to disk.
+
+With threads > 0 pages are handed to a bounded queue and written by a
+pool of writer threads, so rendering carries on while earlier pages are
+written (useful when the bake location is on slow network storage).
+
+Directories that have already been created are cached so each file
+does not need an isdir check.
+
+fsync policy:
+none - leave it to the OS
+each - fsync every file after writing
+end - sync everything once the bake has finished
+
+precompress - list of 'gz', 'br' to also write compressed
+versions of files at least precompress_min_size long.
+
+ZipBakeWriter, TarBakeWriter and PackBakeWriter write pages into a
+single archive instead of loose files - see archive_writer().
+
+write_stream() writes content that arrives in chunks (streamed and
+other large responses) without holding it all in memory.
+
+'''
+
+import glob
+import io
+import json
+import os
+import queue
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from multiprocessing.util import Finalize
+
+from .compress import available_encodings, compress_file, write_compressed
+from .manifest import content_hasher
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+fsync_policies = ["none", "each", "end"]
+
+tar_extensions = [(".tar", ""),
+                  (".tar.gz", "gz"),
+                  (".tgz", "gz"),
+                  (".tar.bz2", "bz2"),
+                  (".tar.xz", "xz"),
+                  (".tar.zst", "zst")]
+
+
+def _bytes_chunks(chunks):
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        yield chunk
+
+
+def _archive_name(file_path, bake_location):
+    name = os.path.relpath(file_path, bake_location)
+    return name.replace("\\", "/")
+
+
+class BakeWriter(object):
+
+    queue_size = 64
+    # False if pages do not end up as loose files in the bake location
+    writes_files = True
+    # False if output from an earlier bake is not kept (for --resume)
+    resumable = True
+
+    def __init__(self, threads=0, fsync="none", precompress=None,
+                 precompress_min_size=1024):
+        if fsync not in fsync_policies:
+            raise ValueError("fsync must be one of {0}".format(fsync_policies))
+        self.threads = threads
+        self.fsync = fsync
+        self.precompress = available_encodings(precompress or [])
+        self.precompress_min_size = precompress_min_size
+        self._directories = set()
+        self._pid = None
+        self._queue = None
+        self._workers = []
+        self._errors = []
+
+    def _start(self):
+        """
+        start writer threads - restarted if this is a forked process
+        """
+        if self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        self._queue = queue.Queue(self.queue_size)
+        self._errors = []
+        self._workers = []
+        for n in range(self.threads):
+            t = threading.Thread(target=self._work, daemon=True)
+            t.start()
+            self._workers.append(t)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                file_path, content, on_written, on_error = item
+                try:
+                    self._write(file_path, content, on_written)
+                except Exception as e:
+                    e.bake_phase = "write"
+                    self._errors.append((e, on_error))
+            finally:
+                self._queue.task_done()
+
+    def handle_errors(self):
+        """
+        pass errors from queued writes to the on_error of the page
+        that failed - raised if it did not give one
+        """
+        while self._errors:
+            error, on_error = self._errors.pop(0)
+            if on_error is None:
+                raise error
+            on_error(error)
+
+    def ensure_directory(self, directory):
+        if directory not in self._directories:
+            os.makedirs(directory, exist_ok=True)
+            self._directories.add(directory)
+
+    def known_directories(self, directories):
+        """
+        directories known to exist (e.g. from an OutputIndex scan)
+        """
+        self._directories.update(directories)
+
+    def _write(self, file_path, content, on_written=None):
+        self.ensure_directory(os.path.dirname(file_path))
+        if type(content) == bytes:
+            f = io.open(file_path, "wb")
+        else:
+            f = io.open(file_path, "w", encoding="utf-8")
+        with f:
+            f.write(content)
+            if self.fsync == "each":
+                f.flush()
+                os.fsync(f.fileno())
+        if self.precompress and len(content) >= self.precompress_min_size:
+            write_compressed(file_path, content, self.precompress)
+        if on_written:
+            on_written(file_path)
+
+    def ensure_compressed(self, file_path, content):
+        """
+        file is unchanged - only write missing compressed versions
+        """
+        if self.precompress and len(content) >= self.precompress_min_size:
+            write_compressed(file_path, content, self.precompress,
+                             only_missing=True)
+
+    def write(self, file_path, content, on_written=None, on_error=None):
+        """
+        write content (bytes or str) to file_path
+        on_written is called with the path once it is on disk
+
+        with writer threads, a failed write is passed to on_error by
+        the next handle_errors() (or flush) - otherwise it is raised
+        here
+        """
+        if self.threads == 0:
+            self._write(file_path, content, on_written)
+            return
+        self._start()
+        self._queue.put((file_path, content, on_written, on_error))
+
+    def write_stream(self, file_path, chunks, on_written=None,
+                     unchanged=None):
+        """
+        write an iterable of bytes (or str) to file_path as it arrives.
+        Written in the calling thread, to a temporary file that
+        replaces file_path once it is complete.
+
+        unchanged (optional) is called with the content hash before
+        file_path is replaced - if it returns True the existing file
+        is kept as it is
+
+        returns (size, written)
+        """
+        self.ensure_directory(os.path.dirname(file_path))
+        temp = "{0}.{1}-{2}.part".format(file_path, os.getpid(),
+                                         threading.get_ident())
+        hasher = content_hasher() if unchanged else None
+        size = 0
+        try:
+            with io.open(temp, "wb") as f:
+                for chunk in _bytes_chunks(chunks):
+                    f.write(chunk)
+                    size += len(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+                if self.fsync == "each":
+                    f.flush()
+                    os.fsync(f.fileno())
+            if hasher and unchanged(hasher.hexdigest()):
+                os.remove(temp)
+                if self.precompress and size >= self.precompress_min_size:
+                    compress_file(file_path, self.precompress,
+                                  only_missing=True)
+                return size, False
+            os.replace(temp, file_path)
+        except BaseException:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+        if self.precompress and size >= self.precompress_min_size:
+            compress_file(file_path, self.precompress)
+        if on_written:
+            on_written(file_path)
+        return size, True
+
+    def flush(self):
+        """
+        wait for all queued files to be written
+        """
+        if self._pid == os.getpid():
+            self._queue.join()
+            self.handle_errors()
+
+    def close(self):
+        self.flush()
+        if self._pid == os.getpid():
+            for t in self._workers:
+                self._queue.put(None)
+            for t in self._workers:
+                t.join()
+            self._pid = None
+        if self.fsync == "end" and hasattr(os, "sync"):
+            os.sync()
+
+
+class ArchiveWriter(BakeWriter):
+    """
+    writes every page into one archive rather than loose files.
+    Names in the archive are relative to the bake location.
+
+    In forked pool workers each process writes an uncompressed part
+    file, which is merged into the archive when the writer is closed.
+    """
+
+    writes_files = False
+    resumable = False
+
+    def __init__(self, archive_path, bake_location):
+        super(ArchiveWriter, self).__init__()
+        self.archive_path = archive_path
+        self.bake_location = bake_location
+        self._owner = os.getpid()
+        self._handle = None
+        self._handle_pid = None
+        self._lock = threading.Lock()
+
+    def _get_handle(self):
+        if self._handle_pid != os.getpid():
+            if os.getpid() == self._owner:
+                self._handle = self._open(self.archive_path, final=True)
+            else:
+                part = "{0}.part{1}".format(self.archive_path, os.getpid())
+                self._handle = self._open(part, final=False)
+                # close the part when the worker process exits
+                Finalize(self, self._close, args=(self._handle,),
+                         exitpriority=10)
+            self._handle_pid = os.getpid()
+        return self._handle
+
+    def _write(self, file_path, content, on_written=None):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        name = _archive_name(file_path, self.bake_location)
+        with self._lock:
+            self._add(self._get_handle(), name, content)
+        if on_written:
+            on_written(file_path)
+
+    def write(self, file_path, content, on_written=None, on_error=None):
+        self._write(file_path, content, on_written)
+
+    def write_stream(self, file_path, chunks, on_written=None,
+                     unchanged=None):
+        """
+        the size is needed before adding to the archive, so content is
+        spooled to a temporary file first. Always written - unchanged
+        is only called to record the hash.
+        """
+        hasher = content_hasher() if unchanged else None
+        size = 0
+        with tempfile.TemporaryFile() as spool:
+            for chunk in _bytes_chunks(chunks):
+                spool.write(chunk)
+                size += len(chunk)
+                if hasher:
+                    hasher.update(chunk)
+            if hasher:
+                unchanged(hasher.hexdigest())
+            spool.seek(0)
+            name = _archive_name(file_path, self.bake_location)
+            with self._lock:
+                self._add_file(self._get_handle(), name, spool, size)
+        if on_written:
+            on_written(file_path)
+        return size, True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        handle = self._get_handle()
+        for part in sorted(glob.glob(self.archive_path + ".part*")):
+            self._merge(handle, part)
+            os.remove(part)
+        self._close(handle)
+        self._handle = None
+        self._handle_pid = None
+        print("archive written to {0}".format(self.archive_path))
+
+
+class ZipBakeWriter(ArchiveWriter):
+
+    def _open(self, path, final):
+        if final:
+            compression = zipfile.ZIP_DEFLATED
+        else:
+            compression = zipfile.ZIP_STORED
+        return zipfile.ZipFile(path, "w", compression)
+
+    def _add(self, handle, name, content):
+        handle.writestr(name, content)
+
+    def _add_file(self, handle, name, f, size):
+        info = zipfile.ZipInfo(name, time.localtime(time.time())[:6])
+        info.compress_type = handle.compression
+        with handle.open(info, "w", force_zip64=True) as dest:
+            shutil.copyfileobj(f, dest)
+
+    def _merge(self, handle, part):
+        with zipfile.ZipFile(part) as z:
+            for info in z.infolist():
+                entry = zipfile.ZipInfo(info.filename, info.date_time)
+                entry.compress_type = handle.compression
+                with z.open(info) as src, \
+                        handle.open(entry, "w", force_zip64=True) as dest:
+                    shutil.copyfileobj(src, dest)
+
+    def _close(self, handle):
+        handle.close()
+
+
+class TarBakeWriter(ArchiveWriter):
+    """
+    compression is '', 'gz', 'bz2', 'xz' or 'zst'
+    (zst needs the zstandard package)
+    """
+
+    def __init__(self, archive_path, bake_location, compression=""):
+        if compression == "zst" and zstandard is None:
+            raise ValueError("zstandard must be installed for .tar.zst")
+        super(TarBakeWriter, self).__init__(archive_path, bake_location)
+        self.compression = compression
+
+    def _open(self, path, final):
+        compression = self.compression if final else ""
+        if compression == "zst":
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, "wb"))
+            tar = tarfile.open(fileobj=stream, mode="w|")
+            tar.zst_stream = stream
+            return tar
+        return tarfile.open(path, "w:" + compression)
+
+    def _add(self, handle, name, content):
+        self._add_file(handle, name, io.BytesIO(content), len(content))
+
+    def _add_file(self, handle, name, f, size):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = time.time()
+        handle.addfile(info, f)
+
+    def _merge(self, handle, part):
+        with tarfile.open(part) as t:
+            for member in t:
+                handle.addfile(member, t.extractfile(member))
+
+    def _close(self, handle):
+        handle.close()
+        if hasattr(handle, "zst_stream"):
+            handle.zst_stream.close()
+
+
+class PackBakeWriter(BakeWriter):
+    """
+    append-only pack file - page contents are appended to NAME and
+    NAME.index gets a json line for each: [path, offset, length]
+
+    A later entry for the same path replaces the earlier one.
+    Several processes can append at once (uses a file lock).
+    """
+
+    writes_files = False
+
+    def __init__(self, pack_path, bake_location):
+        super(PackBakeWriter, self).__init__()
+        self.pack_path = pack_path
+        self.bake_location = bake_location
+        self._files = None
+        self._files_pid = None
+        self._lock = threading.Lock()
+
+    def _get_files(self):
+        if self._files_pid != os.getpid():
+            self._files = (open(self.pack_path, "ab"),
+                           open(self.pack_path + ".index", "a"))
+            self._files_pid = os.getpid()
+        return self._files
+
+    def _write(self, file_path, content, on_written=None):
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+        self._append(file_path, [content])
+        if on_written:
+            on_written(file_path)
+
+    def _append(self, file_path, chunks, hasher=None):
+        """
+        append chunks to the pack - returns the size
+        """
+        name = _archive_name(file_path, self.bake_location)
+        with self._lock:
+            data, index = self._get_files()
+            if fcntl:
+                fcntl.flock(data, fcntl.LOCK_EX)
+            try:
+                offset = data.seek(0, os.SEEK_END)
+                size = 0
+                for chunk in _bytes_chunks(chunks):
+                    data.write(chunk)
+                    size += len(chunk)
+                    if hasher:
+                        hasher.update(chunk)
+                data.flush()
+                index.write(json.dumps([name, offset, size]) + "\n")
+                index.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(data, fcntl.LOCK_UN)
+        return size
+
+    def write(self, file_path, content, on_written=None, on_error=None):
+        self._write(file_path, content, on_written)
+
+    def write_stream(self, file_path, chunks, on_written=None,
+                     unchanged=None):
+        """
+        appended straight to the pack (holding the lock while the
+        content is generated). Always written - unchanged is only
+        called to record the hash.
+        """
+        hasher = content_hasher() if unchanged else None
+        size = self._append(file_path, chunks, hasher)
+        if hasher:
+            unchanged(hasher.hexdigest())
+        if on_written:
+            on_written(file_path)
+        return size, True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self._files_pid == os.getpid():
+            for f in self._files:
+                f.close()
+            self._files_pid = None
+        print("pack written to {0}".format(self.pack_path))
+
+
+def read_pack_index(pack_path):
+    """
+    path -> (offset, length) for the latest version of each page
+    """
+    index = {}
+    with open(pack_path + ".index") as f:
+        for line in f:
+            name, offset, length = json.loads(line)
+            index[name] = (offset, length)
+    return index
+
+
+def read_pack(pack_path):
+    """
+    yields (path, content) for every page in a pack
+    """
+    with open(pack_path, "rb") as f:
+        for name, (offset, length) in read_pack_index(pack_path).items():
+            f.seek(offset)
+            yield name, f.read(length)
+
+
+def archive_writer(archive_path, bake_location):
+    """
+    pick the writer for an archive from its extension
+    """
+    if archive_path.endswith(".zip"):
+        return ZipBakeWriter(archive_path, bake_location)
+    if archive_path.endswith(".pack"):
+        return PackBakeWriter(archive_path, bake_location)
+    for ext, compression in tar_extensions:
+        if archive_path.endswith(ext):
+            return TarBakeWriter(archive_path, bake_location, compression)
+    raise ValueError("Unknown archive type: {0}".format(archive_path))
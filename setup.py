@@ -7,7 +7,9 @@ setup(
               'django_sourdough.management',
               'django_sourdough.management.commands',
               'django_sourdough.serialisers',
+              'django_sourdough.templatetags',
               'django_sourdough.views',
+              'django_sourdough.benchmark',
               ],
   version = '0.5',
   description = 'Django tools for fast population and baking',